@@ -12,6 +12,7 @@ SHAPE=None
 USE_RR=False
 QUANTUM=1
 PLOT_FILE="./plots/Theoritical_plot_FF.png"
+EXTRA_ARGS=()  # e.g. --target-precision 0.01: MAX_T becomes a cap, and each point stops once W is precise enough
 
 # Parse command-line arguments
 while [[ "$#" -gt 0 ]]; do
@@ -27,6 +28,7 @@ while [[ "$#" -gt 0 ]]; do
         --use-rr) USE_RR=True; shift ;;
         --quantum) QUANTUM="$2"; shift ;;
         --plot-file) PLOT_FILE="$2"; shift ;;
+        --target-precision) EXTRA_ARGS+=(--target-precision "$2"); shift ;;
         *) echo "Unknown parameter passed: $1"; exit 1 ;;
     esac
     shift
@@ -48,15 +50,15 @@ for LAMBD in "${LAMBDA_VALUES[@]}"; do
     echo "Running simulation $run_count of $total_runs: with lambda=$LAMBD, d=$D, shape=$SHAPE, use_rr=$USE_RR, quantum=$QUANTUM"
     if [ "$SHAPE" != "None" ]; then
       if [ "$USE_RR" = True ]; then
-        python3 ./main/main.py --lambd $LAMBD --mu $MU --d $D --n $N --csv $CSV_FILE --monitor-interval $MONITOR_INTERVAL --max-t $MAX_T --shape $SHAPE --use-rr --quantum $QUANTUM
+        python3 ./main/main.py --lambd $LAMBD --mu $MU --d $D --n $N --csv $CSV_FILE --monitor-interval $MONITOR_INTERVAL --max-t $MAX_T --shape $SHAPE --use-rr --quantum $QUANTUM "${EXTRA_ARGS[@]}"
       else
-        python3 ./main/main.py --lambd $LAMBD --mu $MU --d $D --n $N --csv $CSV_FILE --monitor-interval $MONITOR_INTERVAL --max-t $MAX_T --shape $SHAPE --quantum $QUANTUM
+        python3 ./main/main.py --lambd $LAMBD --mu $MU --d $D --n $N --csv $CSV_FILE --monitor-interval $MONITOR_INTERVAL --max-t $MAX_T --shape $SHAPE --quantum $QUANTUM "${EXTRA_ARGS[@]}"
       fi
     else
       if [ "$USE_RR" = True ]; then
-        python3 ./main/main.py --lambd $LAMBD --mu $MU --d $D --n $N --csv $CSV_FILE --monitor-interval $MONITOR_INTERVAL --max-t $MAX_T --use-rr --quantum $QUANTUM
+        python3 ./main/main.py --lambd $LAMBD --mu $MU --d $D --n $N --csv $CSV_FILE --monitor-interval $MONITOR_INTERVAL --max-t $MAX_T --use-rr --quantum $QUANTUM "${EXTRA_ARGS[@]}"
       else
-        python3 ./main/main.py --lambd $LAMBD --mu $MU --d $D --n $N --csv $CSV_FILE --monitor-interval $MONITOR_INTERVAL --max-t $MAX_T --quantum $QUANTUM
+        python3 ./main/main.py --lambd $LAMBD --mu $MU --d $D --n $N --csv $CSV_FILE --monitor-interval $MONITOR_INTERVAL --max-t $MAX_T --quantum $QUANTUM "${EXTRA_ARGS[@]}"
       fi
     fi
   done
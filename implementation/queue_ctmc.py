@@ -0,0 +1,123 @@
+"""Exact steady state of small `Queues` systems (FIFO, exponential times, d-choice or random dispatch).
+
+With exponential interarrival and service times and queues truncated at `buffer` jobs (arrivals finding all their
+sampled queues full are lost), the supermarket model is a finite continuous-time Markov chain. Servers are
+interchangeable, so a state is just the sorted tuple of the n queue lengths: this shrinks the state space from
+(buffer + 1)^n to C(n + buffer, n) states.
+
+Every transition changes the total number of jobs by one, so grouping states by that total makes the generator block
+tridiagonal, and its stationary distribution follows exactly from linear level reduction: going down from the top
+level, pi_k = pi_{k-1} R_k with R_k = -A_{k-1} (B_k + R_{k+1} C_{k+1})^-1, where A, B and C are the blocks going one
+level up, staying and going one level down. Only dense solves of level-sized blocks are needed: no scipy.
+"""
+
+import itertools
+import math
+
+import numpy as np
+
+
+def states(n, buffer):
+    """All states (sorted tuples of n queue lengths between 0 and buffer), ordered by total number of jobs."""
+
+    return sorted(itertools.combinations_with_replacement(range(buffer + 1), n), key=sum)
+
+
+def generator(lambd, mu, n, d, buffer):
+    """Build the generator of the chain as sparse triplets.
+
+    Returns (states, rows, cols, rates): the off-diagonal entry of the generator for the transition from states[i]
+    to states[j] is the sum of the rates with rows == i and cols == j. Arrivals come at rate lambd * n and join
+    the shortest of d distinct queues chosen at random; each busy server completes jobs at rate mu.
+    """
+
+    all_states = states(n, buffer)
+    index = {state: i for i, state in enumerate(all_states)}
+    samples = math.comb(n, d)
+    rows, cols, rates = [], [], []
+    for i, state in enumerate(all_states):
+        for value, count in itertools.groupby(state):
+            count = len(list(count))
+            at_least = sum(1 for x in state if x >= value)
+            if value < buffer:
+                # the shortest sampled queue has this length when all d are among the queues at least as long, but
+                # not all among the longer ones
+                p = (math.comb(at_least, d) - math.comb(at_least - count, d)) / samples
+                if p:
+                    position = n - at_least + count - 1  # the last queue of this length: sorting is preserved
+                    rows.append(i)
+                    cols.append(index[state[:position] + (value + 1,) + state[position + 1:]])
+                    rates.append(lambd * n * p)
+            if value > 0:
+                position = n - at_least  # the first queue of this length
+                rows.append(i)
+                cols.append(index[state[:position] + (value - 1,) + state[position + 1:]])
+                rates.append(mu * count)
+    return all_states, np.array(rows), np.array(cols), np.array(rates)
+
+
+def stationary(lambd, mu, n, d, buffer=10):
+    """Return (states, pi), the stationary distribution of the chain, by linear level reduction."""
+
+    all_states, rows, cols, rates = generator(lambd, mu, n, d, buffer)
+    level = np.array([sum(state) for state in all_states])
+    levels = n * buffer + 1
+    start = np.searchsorted(level, np.arange(levels + 1))  # states of level k: start[k] to start[k + 1]
+    offset = np.arange(len(all_states)) - start[level]  # position within the level
+    outflow = np.bincount(rows, rates, len(all_states))
+
+    def block(k, j):
+        """The dense block of the generator from level k to level j."""
+
+        result = np.zeros((start[k + 1] - start[k], start[j + 1] - start[j]))
+        selected = (level[rows] == k) & (level[cols] == j)
+        np.add.at(result, (offset[rows[selected]], offset[cols[selected]]), rates[selected])
+        if k == j:
+            result[np.diag_indices_from(result)] -= outflow[start[k]:start[k + 1]]
+        return result
+
+    r = [None] * levels
+    below = None  # R_{k+1} C_{k+1}
+    for k in range(levels - 1, 0, -1):
+        m = block(k, k) if below is None else block(k, k) + below
+        r[k] = -np.linalg.solve(m.T, block(k - 1, k).T).T
+        below = r[k] @ block(k, k - 1)
+    pi = [np.ones(1)]  # level 0 is the empty system alone
+    for k in range(1, levels):
+        pi.append(pi[-1] @ r[k])
+    pi = np.concatenate(pi)
+    return all_states, pi / pi.sum()
+
+
+def solve(lambd, mu, n, d, buffer=10):
+    """Exact steady-state metrics of the truncated system.
+
+    Returns a dict with 'tail' (tail[i]: fraction of queues with at least i jobs, i = 0..buffer, as sampled by
+    Queues' monitor and plotted by plot_results/th2.py), 'queue_len' (average jobs per queue), 'loss' (fraction of
+    arrivals lost to full queues: keep it negligible for results to hold for the untruncated system) and 'w' (mean
+    response time of accepted jobs, by Little's law).
+    """
+
+    all_states, pi = stationary(lambd, mu, n, d, buffer)
+    lengths = np.array(all_states)
+    counts = np.stack([(lengths >= i).sum(axis=1) for i in range(buffer + 1)], axis=1)  # queues with >= i jobs
+    tail = pi @ counts / n
+    full = counts[:, buffer]
+    loss = pi @ np.array([math.comb(int(f), d) for f in full]) / math.comb(n, d)
+    queue_len = float(tail[1:].sum())
+    return {'tail': tail.tolist(), 'queue_len': queue_len, 'loss': float(loss),
+            'w': queue_len / (lambd * (1 - loss)) if loss < 1 else math.nan}
+
+
+if __name__ == '__main__':  # sanity check
+    # one M/M/1/K queue: P(i jobs) is proportional to rho^i
+    rho, buffer = 0.8, 12
+    p = [rho ** i for i in range(buffer + 1)]
+    result = solve(rho, 1, 1, 1, buffer)
+    assert math.isclose(result['loss'], p[-1] / sum(p), rel_tol=1e-9)
+    assert math.isclose(result['queue_len'], sum(i * x for i, x in enumerate(p)) / sum(p), rel_tol=1e-9)
+    # random dispatch: n independent M/M/1/K queues
+    assert math.isclose(solve(rho, 1, 3, 1, buffer)['queue_len'], result['queue_len'], rel_tol=1e-9)
+    for n, d in (4, 2), (6, 2), (6, 3):
+        result = solve(0.9, 1, n, d, 12)
+        print(f"n={n} d={d}: W {result['w']:.4f}, loss {result['loss']:.2e}")
@@ -0,0 +1,171 @@
+"""Event-free fast path of `Queues` for FIFO queues with a single choice (d=1).
+
+Each job then joins a queue picked uniformly at random, and the n queues are independent single-server FIFO queues
+fed by a split of the arrival stream. The departure times of the jobs of a queue follow the Lindley recursion
+D_i = max(D_{i-1}, A_i) + S_i, which unrolls to D_i = C_i + max_{j <= i} (A_j - C_{j-1}), C being the cumulative
+sum of the service times S: a cumsum and a running maximum over pre-drawn arrays, with no event loop at all.
+"""
+
+import math
+
+import numpy as np
+
+from implementation.queue_sim import Queues
+
+
+def _fill_batch_means(batches, values):
+    """Put an empty BatchMeans in the state that adding the observations in `values` one by one would give.
+
+    Batch sizes double whenever 2 * batches.batches batches are complete, so the final batch size is the smallest
+    power of two leaving fewer complete batches than that; the means are those of consecutive blocks of that size.
+    """
+
+    batch_size = 1
+    while len(values) // batch_size >= 2 * batches.batches:
+        batch_size *= 2
+    complete = len(values) // batch_size * batch_size
+    batches.batch_size = batch_size
+    batches.means = values[:complete].reshape(-1, batch_size).mean(axis=1).tolist()
+    batches.current_sum = float(values[complete:].sum())
+    batches.current_count = len(values) - complete
+
+
+class LindleyQueues(Queues):
+    """A `Queues` simulation computed in one go by run(), for d=1 and FIFO scheduling.
+
+    Interarrival and service times are exponential or, with `shape`, Weibull with the same means (as
+    `weibull_generator` draws them). After run(), the attributes read by main.py -- arrivals, completions (in
+    completion order), queue_size_log and the statistics collectors -- hold what the event-driven run would have
+    produced, up to the random draws.
+    """
+
+    def __init__(self, lambd, mu, n, d=1, use_rr=False, quantum=1, monitor_interval=1, shape=None, event_set=None,
+                 rng=None, quantiles=()):
+        self._pending = []
+        self._response_times = np.empty(0)
+        if not self.applicable(d, use_rr):
+            raise ValueError("the Lindley recursion only applies to FIFO queues with d=1")
+        super().__init__(lambd, mu, n, d, use_rr, quantum, monitor_interval, shape, event_set, rng,
+                         quantiles=quantiles)
+
+    @staticmethod
+    def applicable(d, use_rr):
+        """True if the queues are independent FIFO queues, so that LindleyQueues can replace Queues."""
+
+        return d == 1 and not use_rr
+
+    def _variates(self, rng, mean, size):
+        """`size` interarrival or service times with the given mean."""
+
+        if self.shape:
+            return mean / math.gamma(1 + 1 / self.shape) * rng.weibull(self.shape, size)
+        return rng.exponential(mean, size)
+
+    def _arrival_times(self, rng, max_t):
+        """Arrival times up to max_t of the whole system (rate lambd * n)."""
+
+        mean = 1 / self.arrival_rate
+        expected = max_t / mean
+        chunks, last = [], 0.0
+        while last <= max_t:
+            times = last + np.cumsum(self._variates(rng, mean, int(expected + 6 * math.sqrt(expected)) + 16))
+            chunks.append(times)
+            last = times[-1]
+        times = np.concatenate(chunks)
+        return times[:np.searchsorted(times, max_t, 'right')]
+
+    def run(self, max_t=math.inf, **kwargs):
+        """Simulate up to max_t (from time 0, once); returns 'max_t' as Simulation.run() does.
+
+        The budgets and progress reports of Simulation.run() don't apply here: keyword arguments are ignored.
+        """
+
+        if self.t != 0:
+            raise RuntimeError("LindleyQueues runs once, from time 0")
+        if not math.isfinite(max_t):
+            raise ValueError("LindleyQueues needs a finite max_t")
+        n = self.n
+        rng = np.random.default_rng(self.rng.getrandbits(64))
+        arrivals = self._arrival_times(rng, max_t)
+        jobs = len(arrivals)
+        queue = rng.integers(n, size=jobs)
+        service = self._variates(rng, 1 / self.mu, jobs)
+
+        # Lindley recursion, queue by queue, over the jobs of each queue in arrival order
+        departures = np.empty(jobs)
+        by_queue = np.argsort(queue, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(queue, minlength=n))])
+        sample_times = np.arange(int(max_t // self.monitor_interval) + 1) * self.monitor_interval
+        queue_lengths = np.empty((len(sample_times), n), dtype=np.int64)
+        for i in range(n):
+            jobs_i = by_queue[bounds[i]:bounds[i + 1]]
+            a, s = arrivals[jobs_i], service[jobs_i]
+            c = np.cumsum(s)
+            dep = c + np.maximum.accumulate(a - (c - s))
+            departures[jobs_i] = dep
+            # the sampler sees the events at or before each sample time
+            arrived = np.searchsorted(a, sample_times, 'right')
+            queue_lengths[:, i] = arrived - np.searchsorted(dep, sample_times, 'right')
+
+        completed = np.flatnonzero(departures <= max_t)
+        completed = completed[np.argsort(departures[completed], kind='stable')]  # in completion order
+        response_times = departures[completed] - arrivals[completed]
+        self.arrivals = dict(zip(range(jobs), arrivals.tolist()))
+        self.arrivals_log = self.arrivals
+        self._pending = arrivals[departures > max_t].tolist()
+        self._response_times = response_times
+        self.completions = dict(zip(completed.tolist(), departures[completed].tolist()))
+        self.queue_size_log = queue_lengths.tolist()
+        self._collect(arrivals, departures[completed], response_times, queue_lengths, max_t)
+        self.t = max_t
+        self.events_processed = jobs + len(completed)
+        return 'max_t'
+
+    def pending_arrivals(self):
+        """Return the arrival times of the jobs in the system."""
+
+        return self._pending
+
+    def response_time_quantiles(self):
+        """Return {p: p-quantile of the response time of completed jobs}, exact since all of them are at hand."""
+
+        if not len(self._response_times):
+            return {p: math.nan for p in self.quantiles}
+        return {p: float(np.quantile(self._response_times, p)) for p in self.quantiles}
+
+    def _collect(self, arrivals, departures, response_times, queue_lengths, max_t):
+        """Fill the statistics collectors of Queues from the arrays of the run."""
+
+        tally = self.response_time
+        if len(response_times):
+            tally.count = len(response_times)
+            tally.mean = float(response_times.mean())
+            tally.m2 = float(((response_times - tally.mean) ** 2).sum())
+            tally.min, tally.max = float(response_times.min()), float(response_times.max())
+        _fill_batch_means(self.w_batches, response_times)
+        _fill_batch_means(self.queue_len_batches, queue_lengths.mean(axis=1))
+
+        # number of jobs in the system: +1 at each arrival, -1 at each departure, in time order
+        times = np.concatenate([arrivals, departures])
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        departed = order >= len(arrivals)
+        in_system = np.cumsum(np.where(departed, -1, 1))
+        area = np.concatenate([[0.0], np.cumsum(in_system[:-1] * np.diff(times))]) if len(times) else times
+        jobs = self.jobs
+        jobs.value = len(arrivals) - len(departures)
+        jobs.area = float(area[-1] + jobs.value * (max_t - times[-1])) if len(times) else 0.0
+        jobs.last_t = max_t
+        jobs.max = int(in_system.max()) if len(times) else 0
+
+        # regeneration cycles end whenever a departure empties the system
+        ends = np.flatnonzero(in_system == 0)
+        if len(ends):
+            end_t, end_area, end_completed = times[ends], area[ends], np.cumsum(departed)[ends]
+            cycle_t = np.diff(end_t, prepend=0.0).tolist()
+            cycle_area = np.diff(end_area, prepend=0.0).tolist()
+            cycle_completed = np.diff(end_completed, prepend=0).tolist()
+            for y, completed, tau in zip(cycle_area, cycle_completed, cycle_t):
+                self.w_regenerative.add_cycle(y, completed)
+                self.queue_len_regenerative.add_cycle(y / self.n, tau)
+            self._cycle_start = (float(end_t[-1]), int(end_completed[-1]), float(end_area[-1]))
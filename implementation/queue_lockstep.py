@@ -0,0 +1,182 @@
+"""K independent replications of the `Queues` supermarket model, advanced in lockstep as NumPy arrays.
+
+With exponential interarrival and service times the model is a continuous-time Markov chain, which we simulate by
+uniformization: every replication sees events at the constant rate (lambd + mu) * n; an event is an arrival with
+probability lambd / (lambd + mu), otherwise it is the completion of a server picked uniformly at random -- a no-op
+if that server is idle. Since the rate is the same for all replications, one step advances every replication by one
+event, and the step is a handful of NumPy operations on arrays of length K: the Python overhead is paid once per
+step rather than once per event, which pays off as K grows (hundreds of replications or more).
+
+Queues are FIFO; the arrival times of the jobs in each queue are kept in ring buffers, so that response times are
+exact and the statistics match those of `Queues`: the 'response time' Tally, the 'jobs in system' TimeWeighted and
+the queue lengths sampled every `monitor_interval`. Round Robin and Weibull times are not memoryless and are not
+supported here: use `Queues` for them.
+"""
+
+import math
+
+import numpy as np
+
+from implementation.queue_sim import sample_block
+from libs.statistics import BatchMeans, Tally, TimeWeighted
+
+
+class LockstepQueues:
+    """`replications` independent copies of the supermarket model with n FIFO servers, d choices and rates lambd
+    (per server) and mu.
+
+    Replication k of a run is described by row k of the arrays below; `statistics()` converts them into the
+    collectors `Queues` registers in `sim.statistics`.
+    """
+
+    STEPS_PER_DRAW = 256  # steps whose random numbers are drawn at once
+
+    def __init__(self, lambd, mu, n, d, replications, monitor_interval=1, seed=None):
+        if not 1 <= d <= n:
+            raise ValueError("d must be between 1 and n")
+        self.lambd = lambd
+        self.mu = mu
+        self.n = n
+        self.d = d
+        self.replications = k = replications
+        self.monitor_interval = monitor_interval
+        self.rng = np.random.default_rng(seed)
+        self.t = np.zeros(k)  # simulated time of each replication
+        self.lengths = np.zeros((k, n), dtype=np.int64)  # queue lengths, including the running job
+        # ring buffers with the arrival times of the jobs in each queue: the one running is at index head % capacity
+        self._arrival_times = np.empty((k, n, 16))
+        self._head = np.zeros((k, n), dtype=np.int64)
+        # response times of completed jobs (Welford's algorithm, row by row)
+        self.completed = np.zeros(k, dtype=np.int64)
+        self.w_mean = np.zeros(k)
+        self.w_m2 = np.zeros(k)
+        self.w_min = np.full(k, math.inf)
+        self.w_max = np.full(k, -math.inf)
+        # number of jobs in the system and its integral over time
+        self.jobs = np.zeros(k, dtype=np.int64)
+        self.jobs_max = np.zeros(k, dtype=np.int64)
+        self.area = np.zeros(k)
+        # monitor samples, taken at 0, monitor_interval, 2 * monitor_interval, ... as by Queues' sampler:
+        # queue_len_samples[k, i] is the average queue length of the i-th sample, length_counts[k, l] the number
+        # of sampled queues having length l
+        self.queue_len_samples = np.zeros((k, 0))
+        self.length_counts = np.zeros((k, 1), dtype=np.int64)
+        self._next_sample = np.zeros(k)
+
+    def _draws(self, steps):
+        """Random numbers for `steps` steps: time increments, event kinds, servers and arrival candidates."""
+
+        rng, k, n = self.rng, self.replications, self.n
+        dt = rng.exponential(1 / ((self.lambd + self.mu) * n), (steps, k))
+        arrival = rng.random((steps, k)) < self.lambd / (self.lambd + self.mu)
+        server = rng.integers(n, size=(steps, k))
+        return dt, arrival, server, sample_block(rng, n, self.d, (steps, k))
+
+    def _grow_buffers(self):
+        """Double the capacity of the ring buffers, unrolling each queue to start at index 0."""
+
+        buffers = self._arrival_times
+        capacity = buffers.shape[2]
+        order = (self._head[..., None] + np.arange(capacity)) % capacity
+        self._arrival_times = np.empty(buffers.shape[:2] + (2 * capacity,))
+        self._arrival_times[..., :capacity] = np.take_along_axis(buffers, order, axis=2)
+        self._head[:] = 0
+
+    def _sample(self, rows):
+        """Take the monitor samples due for `rows`, whose state holds until then."""
+
+        lengths = self.lengths[rows]
+        index = np.rint(self._next_sample[rows] / self.monitor_interval).astype(np.int64)
+        self.queue_len_samples[rows, index] = lengths.mean(axis=1)
+        longest = lengths.max()
+        if longest >= self.length_counts.shape[1]:
+            counts = np.zeros((self.replications, longest + 1), dtype=np.int64)
+            counts[:, :self.length_counts.shape[1]] = self.length_counts
+            self.length_counts = counts
+        np.add.at(self.length_counts, (rows[:, None], lengths), 1)
+        self._next_sample[rows] += self.monitor_interval
+
+    def run(self, max_t):
+        """Advance all replications to time max_t; run() can be called again with a later max_t."""
+
+        samples = int(max_t // self.monitor_interval) + 1
+        if samples > self.queue_len_samples.shape[1]:
+            padding = np.full((self.replications, samples - self.queue_len_samples.shape[1]), np.nan)
+            self.queue_len_samples = np.hstack([self.queue_len_samples, padding])
+        lengths, head = self.lengths, self._head
+        while (self.t < max_t).any():
+            dts, arrivals, servers, candidates = self._draws(self.STEPS_PER_DRAW)
+            for dt, arrival, server, candidate in zip(dts, arrivals, servers, candidates):
+                # replications whose next event falls after max_t stop at max_t (the event is dropped: with
+                # memoryless times, it makes no difference to the future)
+                t = np.minimum(self.t + dt, max_t)
+                live = t < max_t
+                if (self._next_sample < t).any():
+                    self._sample(np.flatnonzero(self._next_sample < t))
+                    while (self._next_sample < t).any():  # more than one sample in this step
+                        self._sample(np.flatnonzero(self._next_sample < t))
+                self.area += self.jobs * (t - self.t)
+                self.t = t
+
+                # arrivals join the shortest of their candidates (the first one, among equals)
+                a = np.flatnonzero(live & arrival)
+                if self.d == 1:
+                    queue = candidate[a, 0]
+                else:
+                    choices = candidate[a]
+                    queue = choices[np.arange(len(a)), lengths[a[:, None], choices].argmin(axis=1)]
+                length = lengths[a, queue]
+                if len(a) and length.max() >= self._arrival_times.shape[2]:
+                    self._grow_buffers()
+                capacity = self._arrival_times.shape[2]
+                self._arrival_times[a, queue, (head[a, queue] + length) % capacity] = t[a]
+                lengths[a, queue] = length + 1
+                self.jobs[a] += 1
+                np.maximum(self.jobs_max, self.jobs, out=self.jobs_max)
+
+                # completions of busy servers
+                c = np.flatnonzero(live & ~arrival)
+                busy = lengths[c, server[c]] > 0
+                c = c[busy]
+                server = server[c]
+                arrived = self._arrival_times[c, server, head[c, server] % capacity]
+                head[c, server] += 1
+                lengths[c, server] -= 1
+                self.jobs[c] -= 1
+                w = t[c] - arrived
+                self.completed[c] += 1
+                delta = w - self.w_mean[c]
+                self.w_mean[c] += delta / self.completed[c]
+                self.w_m2[c] += delta * (w - self.w_mean[c])
+                self.w_min[c] = np.minimum(self.w_min[c], w)
+                self.w_max[c] = np.maximum(self.w_max[c], w)
+        while (self._next_sample <= max_t).any():  # the last samples, up to max_t included
+            self._sample(np.flatnonzero(self._next_sample <= max_t))
+
+    def statistics(self):
+        """Return, for each replication, the {name: collector} dict that `Queues.statistics` would hold.
+
+        It includes 'response time', 'jobs in system' and 'queue length batches'; the latter two are closed at
+        the current time.
+        """
+
+        result = []
+        for k in range(self.replications):
+            response_time = Tally()
+            response_time.count = int(self.completed[k])
+            response_time.mean = float(self.w_mean[k])
+            response_time.m2 = float(self.w_m2[k])
+            response_time.min, response_time.max = float(self.w_min[k]), float(self.w_max[k])
+            jobs = TimeWeighted()
+            jobs.last_t = float(self.t[k])
+            jobs.value = int(self.jobs[k])
+            jobs.area = float(self.area[k])
+            jobs.max = int(self.jobs_max[k])
+            queue_len_batches = BatchMeans()
+            for x in self.queue_len_samples[k]:
+                if not math.isnan(x):
+                    queue_len_batches.add(float(x))
+            result.append({'response time': response_time, 'jobs in system': jobs,
+                           'queue length batches': queue_len_batches})
+        return result
+
@@ -0,0 +1,102 @@
+"""Mean-field limit of the supermarket model of `Queues`, for exponential interarrival and service times.
+
+As n grows, the fraction s_i(t) of queues with at least i jobs (the running one included) converges to the solution
+of Mitzenmacher's ODE system ("The power of two choices in randomized load balancing", 2001):
+
+    ds_i/dt = lambd * (s_{i-1}^d - s_i^d) - mu * (s_i - s_{i+1}),    s_0 = 1,
+
+whose fixed point is s_i = rho^((d^i - 1) / (d - 1)) (rho^i for d=1), with rho = lambd / mu < 1. The tails returned
+here have the shape plot_results/th2.py computes from the sampled queue lengths: the fraction of queues with at least
+q jobs, for q in a range of queue sizes.
+"""
+
+import math
+
+import numpy as np
+
+
+def fixed_point(lambd, d, mu=1, tol=1e-12):
+    """Return [s_0, s_1, ...], the steady-state fractions of queues with at least i jobs, until they fall below tol."""
+
+    rho = lambd / mu
+    if not 0 <= rho < 1:
+        raise ValueError("the mean-field model needs lambd < mu")
+    s = [1.0]
+    while s[-1] >= tol and rho > 0:
+        i = len(s)
+        exponent = i if d == 1 else (d ** i - 1) / (d - 1)
+        s.append(rho ** exponent)
+    return s
+
+
+def drift(s, lambd, mu, d):
+    """The right-hand side of the ODE system for s = [s_0, ..., s_L], taking s_{L+1} = 0."""
+
+    ds = np.zeros_like(s)
+    s_d = s ** d
+    ds[1:] = lambd * (s_d[:-1] - s_d[1:]) - mu * (s[1:] - np.append(s[2:], 0.0))
+    return ds
+
+
+def transient(lambd, d, times, mu=1, initial=None, max_len=None, step=None):
+    """Solve the ODE system from `initial` (default: an empty system) and return its state at `times`.
+
+    The result is an array with one row [s_0, ..., s_L] per time. The system is truncated at L = `max_len` (by
+    default, where the fixed point becomes negligible, plus some room) and integrated with the classical fourth
+    order Runge-Kutta method, with a `step` small enough for stability by default.
+    """
+
+    if max_len is None:
+        max_len = 2 * len(fixed_point(lambd, d, mu)) + 10
+        if initial is not None:
+            max_len = max(max_len, len(initial) + 10)
+    s = np.zeros(max_len + 1)
+    s[0] = 1.0
+    if initial is not None:
+        s[:len(initial)] = initial
+    if step is None:
+        step = 0.5 / (lambd * d + 2 * mu)
+    result = np.empty((len(times), max_len + 1))
+    t = 0.0
+    for row, until in enumerate(times):
+        if until < t:
+            raise ValueError("times must be sorted")
+        while t < until:
+            h = min(step, until - t)
+            k1 = drift(s, lambd, mu, d)
+            k2 = drift(s + h / 2 * k1, lambd, mu, d)
+            k3 = drift(s + h / 2 * k2, lambd, mu, d)
+            k4 = drift(s + h * k3, lambd, mu, d)
+            s = s + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            t += h
+        result[row] = s
+    return result
+
+
+def tail(s, queue_sizes=range(1, 21)):
+    """Return the fraction of queues with at least q jobs for each q in queue_sizes, as plot_results/th2.py does."""
+
+    return [float(s[q]) if q < len(s) else 0.0 for q in queue_sizes]
+
+
+def mean_queue_length(s):
+    """The average number of jobs per queue: sum of s_i for i >= 1."""
+
+    return float(sum(s[1:]))
+
+
+def response_time(s, lambd):
+    """The average time in the system W, by Little's law."""
+
+    return mean_queue_length(s) / lambd
+
+
+if __name__ == '__main__':  # sanity check
+    # with d=1 the queues are independent M/M/1 queues: W = 1 / (mu - lambd)
+    assert math.isclose(response_time(fixed_point(0.9, 1), 0.9), 10, rel_tol=1e-9)
+    # starting from an empty system, the transient approaches the fixed point
+    for d in 1, 2, 5:
+        s = transient(0.7, d, [500])[0]
+        fp = fixed_point(0.7, d)
+        assert np.allclose(s[:len(fp)], fp, atol=1e-6), d
+        print(f"d={d}: W {response_time(fp, 0.7):.4f}, tail {[round(x, 4) for x in tail(fp, range(1, 6))]}")
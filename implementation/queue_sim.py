@@ -1,15 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
+import array
 import csv
 import collections
-import heapq
 import logging
 import matplotlib.pyplot as plt
 import numpy as np
-from random import expovariate, randrange, sample, seed
 
-from libs.discrete_event_sim import Simulation, Event
+from libs.discrete_event_sim import Simulation
+from libs.statistics import BatchMeans, LogHistogram, Regenerative, Tally, TimeWeighted, mser
 # One possible modification is to use a different distribution for job sizes or and/or interarrival times.
 # Weibull distributions (https://en.wikipedia.org/wiki/Weibull_distribution) are a generalization of the
 # exponential distribution, and can be used to see what happens when values are more uniform (shape > 1,
@@ -24,20 +24,34 @@ from libs.workloads import weibull_generator
 
 
 # columns saved in the CSV file
-CSV_COLUMNS = ['lambd', 'mu', 'max_t', 'n', 'd', 'w','queue_size', 'quantum', 'weibull_shape']
+CSV_COLUMNS = ['lambd', 'mu', 'max_t', 'n', 'd', 'w','queue_size', 'quantum', 'weibull_shape',
+               'w_ci', 'queue_len', 'queue_len_ci', 'w_quantiles', 'sim_t']
+# w_ci and queue_len_ci: 95% CI half widths (batch means); w_quantiles: {p: p-quantile of the response time};
+# sim_t: the simulated time actually run (max_t is the cap)
 #CSV_COLUMNS = ['lambd', 'mu', 'max_t', 'n', 'd', 'w', 'queue_size', 'waiting_time', 'server_utilization']
 
 
-class MonitorQueueSizes(Event):
-    """Monitor the queue sizes, waiting times, and server utilization at regular intervals."""
+def sample_block(rng, n, d, shape):
+    """Draw d distinct queues out of n for each index of `shape`, in random order as random.sample() gives them.
 
-    def __init__(self, interval=1):
-        self.interval = interval
+    Returns an array of shape `shape + (d,)`. The i-th queue of a sample is drawn among the n - i not chosen yet,
+    by skipping over the chosen ones in increasing order.
+    """
+
+    samples = np.empty(tuple(shape) + (d,), dtype=np.int64)
+    chosen = []  # the queues chosen so far, sorted elementwise
+    for i in range(d):
+        queue = rng.integers(n - i, size=shape)
+        for previous in chosen:
+            queue += queue >= previous
+        samples[..., i] = queue
+        sorted_chosen = []
+        for previous in chosen:
+            sorted_chosen.append(np.minimum(previous, queue))
+            queue = np.maximum(previous, queue)
+        chosen = sorted_chosen + [queue]
+    return samples
 
-    def process(self, sim: 'Queues'):
-        queue_lengths = [sim.queue_len(i) for i in range(sim.n)]       
-        sim.queue_size_log.append(queue_lengths)
-        sim.schedule(self.interval, self)
 
 class Queues(Simulation):
     """Simulation of a system with n servers and n queues.
@@ -47,16 +61,25 @@ class Queues(Simulation):
     the shortest one.
     """
 
-    def __init__(self, lambd, mu, n, d,use_rr=False, quantum=1, monitor_interval=1, shape=None):
-        super().__init__()
-        #self.running = [None] * n  # if not None, the id of the running job (per queue)
-        self.running = [None for _ in range(n)]  # if not None, the id of the running job
-        heapq.heapify(self.events)  # treat the list as a heap
-        #self.running = [(None, None) for _ in range(n)]  # (job_id, remaining_time) for Round Robin
+    SAMPLE_BLOCK = 1024  # arrivals whose sampled queues are drawn at once
+    QUANTILE_BINS_PER_DECADE = 100  # resolution of the response time histogram: bins are 2.3% wide
+    MSER_BATCHES = 2048  # without keep_jobs, response times are kept as up to twice as many batch means for MSER
+
+    def __init__(self, lambd, mu, n, d,use_rr=False, quantum=1, monitor_interval=1, shape=None, event_set=None,
+                 rng=None, keep_jobs=True, quantiles=()):
+        super().__init__(event_set, rng)  # all random draws come from self.rng
+        # jobs are (job_id, arrival time, service time) tuples; with Round Robin, the service time of a queued job
+        # is what it has left
+        self.running = [None for _ in range(n)]  # if not None, the running job (per queue)
         self.queues = [collections.deque() for _ in range(n)]  # FIFO queues of the system
         # NOTE: we don't keep the running jobs in self.queues
+        self.lengths = array.array('l', [0]) * n  # queue lengths, running jobs included
+        # with keep_jobs, the arrival and completion time of every job is kept, which takes memory proportional to
+        # the number of jobs ever seen; otherwise, memory is proportional to the jobs in the system, and results
+        # only come from the statistics collectors
+        self.keep_jobs = keep_jobs
         self.arrivals = {}  # dictionary mapping job id to arrival time
-        self.arrivals_log = {}  # dictionary mapping job id to arrival time
+        self.arrivals_log = self.arrivals  # same dictionary, under the name used by older scripts
         self.completions = {}  # dictionary mapping job id to completion time
         self.lambd = lambd
         self.n = n
@@ -69,115 +92,236 @@ class Queues(Simulation):
         self.waiting_times =[]  # Initialize the list to store waiting times for RR
         #self.waiting_times = collections.defaultdict(list)  # Initialize waiting times dictionary
         self.shape = shape  # Ensure shape is initialized
+        # the d queues sampled by each arrival are drawn in blocks, row by row; each block has its own generator
+        # seeded from self.rng, so that self.rng stays the only source of randomness (see Simulation.branch())
+        self._sampled_queues = []
+        self._sampled = 0
         self.use_rr = use_rr
         self.quantum = quantum
-        self.schedule(self.generate_interarrival_time(), Arrival(0)) # schedule the first arrival
-        self.schedule(0, MonitorQueueSizes(monitor_interval))
+        self.response_time = self.add_statistic('response time', Tally())  # of completed jobs
+        self.jobs = self.add_statistic('jobs in system', TimeWeighted())
+        # confidence intervals from this run: batch means over response times and sampled average queue lengths,
+        # and regenerative estimates whose cycles start whenever the whole system is empty (only practical for
+        # small n or low loads, where this happens often)
+        self.w_batches = self.add_statistic('response time batches', BatchMeans())
+        # without keep_jobs, steady_state() looks for the warm-up in these finer batch means instead of the response
+        # times themselves
+        self.w_mser_batches = None if keep_jobs else BatchMeans(self.MSER_BATCHES)
+        self.queue_len_batches = self.add_statistic('queue length batches', BatchMeans())
+        self.w_regenerative = self.add_statistic('response time regenerative', Regenerative())
+        self.queue_len_regenerative = self.add_statistic('queue length regenerative', Regenerative())
+        self._cycle_start = (0, 0, 0.0)  # time, completed jobs and jobs-in-system area at the last regeneration
+        # response time quantiles (e.g., 0.99 for the P99) come from a logarithmic histogram, whose memory depends
+        # on the range of response times rather than on the number of jobs; it is only kept if quantiles are asked
+        self.quantiles = tuple(quantiles)
+        self.w_histogram = None
+        if self.quantiles:
+            self.w_histogram = self.add_statistic('response time histogram',
+                                                  LogHistogram(self.QUANTILE_BINS_PER_DECADE))
+        self.schedule_arrival(0) # schedule the first arrival
+        self.monitor_interval = monitor_interval
+        self.add_sampler(monitor_interval, self.monitor_queue_sizes)
     
 
     def generate_interarrival_time(self):
-        return weibull_generator(self.shape, 1 / (self.lambd*self.n))() if self.shape else expovariate(self.lambd * self.n)
+        if self.shape:
+            return weibull_generator(self.shape, 1 / (self.lambd*self.n), self.rng)()
+        return self.rng.expovariate(self.lambd * self.n)
 
     def generate_service_time(self):
-        return weibull_generator(self.shape, 1 / self.mu)() if self.shape else expovariate(self.mu)
+        return weibull_generator(self.shape, 1 / self.mu, self.rng)() if self.shape else self.rng.expovariate(self.mu)
     
+    def reseed(self, seed):
+        """Restart self.rng, dropping the queues sampled ahead of time from the previous stream."""
+
+        super().reseed(seed)
+        self._sampled_queues = []
+        self._sampled = 0
+
     def supermarket_decision(self):
         if self.d == 1:  # Special case for d=1
-            return randrange(self.n)
+            return self.rng.randrange(self.n)
         else:
-            sample_queues = sample(range(self.n), self.d)
-            return min(sample_queues, key=lambda i: len(self.queues[i]))
+            i = self._sampled
+            if i == len(self._sampled_queues):
+                rng = np.random.default_rng(self.rng.getrandbits(64))
+                self._sampled_queues = sample_block(rng, self.n, self.d, (self.SAMPLE_BLOCK,)).tolist()
+                i = 0
+            self._sampled = i + 1
+            return min(self._sampled_queues[i], key=self.lengths.__getitem__)  # the first of the shortest queues
         
     def schedule_arrival(self, job_id):
-        self.schedule(self.generate_interarrival_time(), Arrival(job_id))
+        self.call_later(self.generate_interarrival_time(), self.arrival, job_id)
 
     def schedule_completion(self, job_id, queue_index, execution_time):
         if self.use_rr:
             self.schedule_completion_rr(job_id, queue_index, execution_time)
         else:
-            self.schedule(execution_time, Completion(job_id, queue_index))  # Removed remaining_time and is_interruption
+            self.call_later(execution_time, self.completion, job_id, queue_index)
 
     def schedule_completion_rr(self, job_id, queue_index, remaining_time):
-        #self.schedule(self.quantum, CompletionRR(job_id, queue_index, max(0, remaining_time - self.quantum)))
         if remaining_time > self.quantum:
-             self.schedule(self.quantum, CompletionRR(job_id, queue_index, remaining_time - self.quantum))
+             self.call_later(self.quantum, self.completion_rr, job_id, queue_index, remaining_time - self.quantum)
+        else:
+             self.call_later(remaining_time, self.completion_rr, job_id, queue_index, 0)
+
+    def monitor_queue_sizes(self):
+        """Periodic sampler: record the length of every queue."""
+
+        queue_lengths = self.lengths.tolist()
+        self.queue_size_log.append(queue_lengths)
+        self.queue_len_batches.add(sum(queue_lengths) / self.n)
+
+    def regeneration(self):
+        """The system just became empty: close a regeneration cycle.
+
+        All jobs of a cycle arrive and leave within it, so their total response time equals the area under the
+        number of jobs in the system over the cycle.
+        """
+
+        t, completed, area = self._cycle_start
+        cycle_area = self.jobs.area - area
+        self.w_regenerative.add_cycle(cycle_area, self.response_time.count - completed)
+        self.queue_len_regenerative.add_cycle(cycle_area / self.n, self.t - t)
+        self._cycle_start = (self.t, self.response_time.count, self.jobs.area)
+
+    def steady_state(self, batch_size=5):
+        """Estimate W and the average queue length without the initial transient, detected with MSER-5.
+
+        Response times are taken in completion order, queue lengths from the monitor samples (averaged over the
+        queues). Returns a dict with the truncated means, their batch-means 95% CI half widths and the number of
+        discarded observations; 'warmup_t' is the time of the first kept queue-length sample.
+
+        Without keep_jobs, response times are not stored one by one: the truncation is computed over the means of
+        w_mser_batches instead (MSER_BATCHES to twice as many), and only discards whole batches.
+        """
+
+        queue_lens = [sum(lengths) / self.n for lengths in self.queue_size_log]
+        if self.keep_jobs:
+            arrivals = self.arrivals
+            response_times = [t - arrivals[job_id] for job_id, t in self.completions.items()]
+            w_series = response_times, batch_size, 1
         else:
-             self.schedule(remaining_time, CompletionRR(job_id, queue_index, 0))  # Removed is_interruption
+            w_series = self.w_mser_batches.means, 1, self.w_mser_batches.batch_size
+        result = {}
+        for name, (series, mser_batch_size, weight) in ('w', w_series), ('queue_len', (queue_lens, batch_size, 1)):
+            discard = mser(series, mser_batch_size)
+            batches = BatchMeans()
+            for x in series[discard:]:
+                batches.add(x)
+            result[name], result[f'{name}_ci'] = batches.confidence_interval()
+            result[f'{name}_discarded'] = discard * weight
+        result['warmup_t'] = result['queue_len_discarded'] * self.monitor_interval
+        return result
+
+    def response_time_quantiles(self):
+        """Return {p: estimated p-quantile of the response time of completed jobs} for p in `quantiles`."""
+
+        return {p: self.w_histogram.quantile(p) for p in self.quantiles}
+
+    def jobs_in_system(self):
+        """Return the number of jobs arrived and not completed yet."""
+
+        return self.jobs.value
+
+    def pending_arrivals(self):
+        """Return the arrival times of the jobs in the system, running or queued."""
+
+        running = [job[1] for job in self.running if job is not None]
+        return running + [job[1] for queue in self.queues for job in queue]
 
     def queue_len(self, i):
         """Return the length of the i-th queue.
         
         Notice that the currently running job is counted even if it is not in self.queues[i]."""
 
-        return (self.running[i] is not None) + len(self.queues[i])
-class Arrival(Event):
-    def __init__(self, job_id):
-        self.id = job_id
+        return self.lengths[i]
 
-    def process(self, sim: Queues):
-        sim.arrivals[self.id] = sim.t       # Record arrival time for all jobs
-        sim.arrivals_log[self.id] = sim.t   # Record arrival time for all jobs
-        queue_index = sim.supermarket_decision() if sim.d > 1 else randrange(sim.n)
-        
-        #print(f"[Time {sim.t:.2f}] Job {self.id} arrived at queue {queue_index}, queue length: {len(sim.queues[queue_index])}")    
-        if sim.running[queue_index] is None: # If the queue is empty, start the job
-            execution_time = sim.generate_service_time()
-            sim.running[queue_index] = (self.id, execution_time) if sim.use_rr else self.id
-            sim.schedule_completion(self.id, queue_index, execution_time)
+    # Events are scheduled as callbacks through call_later() rather than as Event objects, to avoid allocating an
+    # object for each arrival and completion.
+
+    def arrival(self, job_id):
+        """Job `job_id` arrives and joins a queue."""
+
+        if self.keep_jobs:
+            self.arrivals[job_id] = self.t  # Record arrival time for all jobs
+        self.jobs.add(self.t, 1)
+        queue_index = self.supermarket_decision() if self.d > 1 else self.rng.randrange(self.n)
+        self.lengths[queue_index] += 1
+
+        job = (job_id, self.t, self.generate_service_time())
+        if self.running[queue_index] is None: # If the queue is empty, start the job
+            self.running[queue_index] = job
+            self.schedule_completion(job_id, queue_index, job[2])
         else:
-            sim.queues[queue_index].append((self.id, sim.generate_service_time()) if sim.use_rr else self.id)
-        
-        sim.schedule_arrival(self.id + 1)
+            self.queues[queue_index].append(job)
+
+        self.schedule_arrival(job_id + 1)
+
+    def departure(self, job_id, arrival_t, queue_index):
+        """Account for job `job_id`, arrived at arrival_t, leaving server `queue_index` now."""
 
-class Completion(Event):
-    def __init__(self, job_id, queue_index):  # Removed remaining_time and is_interruption
-        self.job_id = job_id
-        self.queue_index = queue_index
+        response_time = self.t - arrival_t
+        if self.keep_jobs:
+            self.completions[job_id] = self.t
+        else:
+            self.w_mser_batches.add(response_time)
+        self.response_time.add(response_time)
+        self.w_batches.add(response_time)
+        if self.w_histogram is not None:
+            self.w_histogram.add(response_time)
+        self.jobs.add(self.t, -1)
+        self.lengths[queue_index] -= 1
+        if not self.jobs.value:
+            self.regeneration()
 
-    def process(self, sim: Queues):
-        queue_index = self.queue_index
-        assert sim.running[queue_index] == self.job_id
-        # Record completion time for non-RR jobs
+    def completion(self, job_id, queue_index):
+        """Job `job_id` completes on server `queue_index`."""
 
-        sim.completions[self.job_id] = sim.t
+        running = self.running[queue_index]
+        assert running[0] == job_id
+        self.departure(job_id, running[1], queue_index)
 
-        queue:collections.deque[int] = sim.queues[queue_index]
+        queue = self.queues[queue_index]
         if queue: # If the queue is not empty, start the next job
-            new_job_id = queue.popleft()  # Removed new_execution_time
-            new_execution_time = sim.generate_service_time()  # Generate new service time here
-            sim.running[queue_index] = new_job_id
-            sim.schedule_completion(new_job_id, queue_index, new_execution_time)
+            new_job = self.running[queue_index] = queue.popleft()
+            self.schedule_completion(new_job[0], queue_index, new_job[2])
         else: 
-            sim.running[queue_index] = None
-
-class CompletionRR(Event):
-    def __init__(self, job_id, queue_index, remaining_time):
-        self.job_id = job_id
-        self.queue_index = queue_index
-        self.remaining_time = remaining_time
+            self.running[queue_index] = None
 
-    def process(self, sim: Queues):
-        queue_index = self.queue_index
-        current_job = sim.running[queue_index]
+    def completion_rr(self, job_id, queue_index, remaining_time):
+        """Job `job_id` ends its quantum on server `queue_index` with `remaining_time` left (Round Robin)."""
 
-            # If job is fully complete, record its completion time.
-        if self.remaining_time == 0:
-            sim.completions[self.job_id] = sim.t
+        arrival_t = self.running[queue_index][1]
+        # If job is fully complete, record its completion time.
+        if remaining_time == 0:
+            self.departure(job_id, arrival_t, queue_index)
         else:
             # If the queue is empty, resume the same job immediately.
-            if not sim.queues[queue_index]:
-                sim.schedule_completion(self.job_id, queue_index, self.remaining_time)
+            if not self.queues[queue_index]:
+                self.schedule_completion(job_id, queue_index, remaining_time)
                 return
             else:
                 # Otherwise, requeue the unfinished job.
-                sim.queues[queue_index].append((self.job_id, self.remaining_time))
+                self.queues[queue_index].append((job_id, arrival_t, remaining_time))
         
         # If there is another job waiting, pick it from the queue.
-        if sim.queues[queue_index]:
-            new_job = sim.queues[queue_index].popleft()
-            new_job_id, new_execution_time = new_job
-            sim.running[queue_index] = (new_job_id, new_execution_time)
-            sim.schedule_completion(new_job_id, queue_index, new_execution_time)
+        if self.queues[queue_index]:
+            new_job = self.running[queue_index] = self.queues[queue_index].popleft()
+            self.schedule_completion(new_job[0], queue_index, new_job[2])
         else:
-            sim.running[queue_index] = None
+            self.running[queue_index] = None
+
+
+if __name__ == '__main__':  # sanity check; run from the repository root as `python -m implementation.queue_sim`
+    import random
 
+    # response time quantiles from the histogram, against the exact ones from the per-job records
+    for n, d, lambd, shape in (1, 1, 0.9, None), (10, 2, 0.9, None), (5, 3, 0.8, 0.5):
+        sim = Queues(lambd, 1, n, d, shape=shape, rng=random.Random(1), keep_jobs=True, quantiles=(0.5, 0.95, 0.99))
+        sim.run(5000)
+        response_times = [t - sim.arrivals[job_id] for job_id, t in sim.completions.items()]
+        for p, estimate in sim.response_time_quantiles().items():
+            exact = float(np.quantile(response_times, p))
+            print(f"n={n} d={d} lambd={lambd} shape={shape} p={p}: histogram {estimate:.4f}, exact {exact:.4f}")
+            assert abs(estimate - exact) <= 0.02 * exact, (n, d, p)
@@ -1,48 +1,702 @@
-import heapq
+import collections
+import itertools
+import json
 import logging
+import os
+import pickle
+import random
+import sys
+import time
+import traceback
+import zlib
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+import msgpack
+
+from libs.event_sets import make_event_set
+
+# Handlers and levels are left to the application: importing the engine doesn't configure logging.
+logger = logging.getLogger(__name__)
+
+# Priority classes for events happening at the same time: lower values are processed first.
+PRIORITY_STATE = 0  # events changing the state of the simulation
+PRIORITY_MONITOR = 10  # events observing the state, which should see every state change happening at that time
+
+CHECKPOINT_FORMAT = 'discrete_event_sim checkpoint'
+CHECKPOINT_VERSION = 1
 
-# TODO: implement the event queue!
-# suggestion: have a look at the heapq library (https://docs.python.org/dev/library/heapq.html)
-# and in particular heappush and heappop
 
 class Simulation:
     """Subclass this to represent the simulation state.
 
     Here, self.t is the simulated time and self.events is the event queue.
+
+    The event queue holds [time, priority, seq, event, args] records: `priority` is the event's priority class and
+    `seq` a counter increasing at every scheduling, so that events at the same time and with the same priority are
+    processed in FIFO order, and record comparison never needs to look at the events themselves. For Event objects
+    `args` is None and `event.process(sim)` is called; for callbacks scheduled with call_at() or call_later(),
+    `event` is the callable and is called as `event(*args)`, without allocating an Event object.
+
+    Canceled events stay in the queue as tombstones (records whose event is None) and are skipped when popped;
+    when tombstones are more than COMPACT_MIN and than half the queue, the queue is rebuilt without them. Records
+    popped to be processed get None as `seq`, so that canceling them afterwards does nothing.
+
+    Models report what happens through trace(), grouping messages in categories that are off until enabled with
+    enable_tracing(); see there.
+
+    A running simulation can be saved with checkpoint() and resumed with restore(), also automatically every given
+    amount of simulated time (see enable_checkpoints()).
     """
 
-    def __init__(self):
+    COMPACT_MIN = 1024  # minimum number of tombstones before compacting the event queue
+    RUN_CHUNK = 10000  # events processed between checks of run() budgets and progress
+
+    def __init__(self, event_set=None, rng=None):
         """Extend this method with the needed initialization.
 
         You can call super().__init__() there to call the code here.
+
+        `event_set` selects the event queue implementation: None or 'heap' (binary heap), 'calendar' (calendar
+        queue), 'ladder' (ladder queue), or an instance of `event_sets.EventSet`.
+
+        `rng` is the random.Random instance the model draws from, so that simulations running side by side (e.g.,
+        in threads) don't share state; by default, a new one is seeded from the `random` module, so that
+        random.seed() still makes runs repeatable.
         """
 
         self.t = 0  # simulated time
-        self.events = [] #Done TODO: set up self.events as an empty queue
-        heapq.heapify(self.events)  # treat the list as a heap
+        self.rng = rng if rng is not None else random.Random(random.getrandbits(64))
+        self.events = make_event_set(event_set)  # the event queue
+        self._seq = itertools.count()  # tie-breaker for events with the same time and priority
+        self.canceled = 0  # number of tombstones in the event queue
+        self.samplers = []  # periodic samplers, see add_sampler()
+        self._next_sample = float('inf')  # earliest time at which a sampler is due
+        self.observers = []  # objects whose record() method is called after each event, see _run_observed()
+        self.profiler = None
+        self.traced = frozenset()  # trace categories enabled, see enable_tracing()
+        self.checkpoint_path = None  # see enable_checkpoints()
+        self.checkpoint_interval = None
+        self._next_checkpoint = float('inf')
+        self.events_processed = 0  # events popped by run() so far
+        self.statistics = {}  # name -> collector from libs.statistics, see add_statistic()
 
     def schedule(self, delay, event):
-        """Add an event to the event queue after the required delay."""
+        """Add an event to the event queue after the required delay. Returns a handle that can cancel it."""
         #logging.debug(f"Scheduling event '{type(event).__name__}' at time {self.t + delay:.2f}") #Add debug logging
-        #Done TODO: add event to the queue at time self.t + delay
-        heapq.heappush(self.events, (self.t + delay, event))
-
-    def run(self, max_t=float('inf')):
-        """Run the simulation. If max_t is specified, stop it at that time."""
-        logging.info(f"Simulation starting. max_t={max_t}") # Log simulation start
-        while self.events and self.t < max_t:  #Done TODO: as long as the event queue is not empty:
-            t, event = heapq.heappop(self.events) #Done TODO: get the first event from the queue
-            if t > max_t:
+        record = [self.t + delay, event.priority, next(self._seq), event, None]
+        self.events.push(record)
+        return EventHandle(self, record)
+
+    def schedule_many(self, items):
+        """Add many (delay, event) pairs to the event queue at once.
+
+        This is much faster than repeated schedule() calls for large initial populations, since the event set can
+        build itself in a single pass (O(N) for the binary heap). No handles are returned: use schedule() for
+        events that may need canceling.
+        """
+
+        t, seq = self.t, self._seq
+        self.events.push_many([[t + delay, event.priority, next(seq), event, None] for delay, event in items])
+
+    def call_many(self, items, priority=PRIORITY_STATE):
+        """Schedule many (delay, fn, args) callbacks at once; see schedule_many()."""
+
+        t, seq = self.t, self._seq
+        self.events.push_many([[t + delay, priority, next(seq), fn, args] for delay, fn, args in items])
+
+    def call_at(self, t, fn, *args, priority=PRIORITY_STATE):
+        """Call fn(*args) at time t.
+
+        Returns the event record, which can be passed to cancel(); no handle object is allocated, so that this
+        stays cheap enough for the hot paths of a model.
+        """
+
+        record = [t, priority, next(self._seq), fn, args]
+        self.events.push(record)
+        return record
+
+    def call_later(self, delay, fn, *args, priority=PRIORITY_STATE):
+        """Call fn(*args) after the required delay. Returns the event record, as call_at() does."""
+
+        record = [self.t + delay, priority, next(self._seq), fn, args]
+        self.events.push(record)
+        return record
+
+    def cancel(self, record):
+        """Cancel a scheduled event given its record; does nothing if it was already canceled or processed."""
+
+        if record[3] is None or record[2] is None:
+            return
+        record[3] = None  # leave a tombstone, the run loop will skip it
+        self.canceled += 1
+        if self.canceled > self.COMPACT_MIN and 2 * self.canceled > len(self.events):
+            self.compact()
+
+    def add_statistic(self, name, collector):
+        """Register a collector (see libs.statistics) under `name` in self.statistics and return it."""
+
+        self.statistics[name] = collector
+        return collector
+
+    def add_sampler(self, interval, fn, *args, start=None):
+        """Call fn(*args) every `interval` time units, starting from `start` (by default, now).
+
+        Samplers don't go through the event queue: run() calls them when it is about to process the first event
+        after their time, so they observe the state after every event happening at or before it (as events with
+        PRIORITY_MONITOR would). They must not schedule events. A sampler returning False is removed. Samplers
+        with different intervals are independent.
+        """
+
+        start = self.t if start is None else start
+        sampler = Sampler(interval, fn, args, start)
+        self.samplers.append(sampler)
+        self._next_sample = min(self._next_sample, sampler.next_t)
+        return sampler
+
+    def _run_samplers(self, until, inclusive=False):
+        """Run all samplers due before `until` (or at `until`, if `inclusive`), in time order."""
+
+        while self.samplers:
+            due = min(sampler.next_t for sampler in self.samplers)
+            if due > until or (due == until and not inclusive):
                 break
+            self.t = due
+            for sampler in list(self.samplers):
+                if sampler.next_t == due and self._call_sampler(sampler) is False:
+                    self.samplers.remove(sampler)
+                else:
+                    sampler.advance(due)
+        self._next_sample = min((sampler.next_t for sampler in self.samplers), default=float('inf'))
+
+    def _call_sampler(self, sampler):
+        if not self.observers:
+            return sampler.fn(*sampler.args)
+        seq = self._seq
+        before = next(seq)
+        start = time.perf_counter()
+        result = sampler.fn(*sampler.args)
+        duration = time.perf_counter() - start
+        scheduled = next(seq) - before - 1
+        for observer in self.observers:
+            observer.record(self, event_name(sampler.fn, sampler.args), start, duration, scheduled)
+        return result
+
+    def compact(self):
+        """Rebuild the event queue without the tombstones left by canceled events."""
+
+        self.events.rebuild([record for record in self.events if record[3] is not None])
+        self.canceled = 0
+
+    def enable_profiling(self):
+        """Record, for each event type, the number of events processed, their total and maximum wall-clock time and
+        the number of events they scheduled. Returns the Profiler; results are also in `self.profiler`."""
+
+        self.profiler = Profiler()
+        self.observers.append(self.profiler)
+        return self.profiler
+
+    def enable_chrome_trace(self, path, counters=None, counter_interval=100):
+        """Write each processed event to `path` as a slice in the Chrome trace format (viewable in Perfetto or
+        chrome://tracing); see ChromeTraceWriter. Returns the writer, whose close() must be called at the end."""
+
+        writer = ChromeTraceWriter(path, counters, counter_interval)
+        self.observers.append(writer)
+        return writer
+
+    def enable_checkpoints(self, path, interval):
+        """Make run() save a checkpoint to `path` every `interval` units of simulated time.
+
+        The checkpoint is overwritten each time; the setting is saved with it, so a restored simulation keeps
+        checkpointing.
+        """
+
+        assert interval > 0
+        self.checkpoint_path = path
+        self.checkpoint_interval = interval
+        self._next_checkpoint = self.t + interval
+
+    def checkpoint(self, path):
+        """Save the simulation to `path`, from which restore() can resume it.
+
+        The file is a msgpack map holding the clock, the state of the `random` module and the pickled (and
+        compressed) simulation object, which includes the event queue, all model state and self.rng; it must be
+        called between events, not from within one. Observers (e.g., the profiler) are not saved.
+        """
+
+        version, internal_state, gauss_next = random.getstate()
+        envelope = {
+            'format': CHECKPOINT_FORMAT,
+            'version': CHECKPOINT_VERSION,
+            'class': f'{type(self).__module__}.{type(self).__qualname__}',
+            't': self.t,
+            'random': [version, list(internal_state), gauss_next],
+            'state': zlib.compress(pickle.dumps(self, pickle.HIGHEST_PROTOCOL)),
+        }
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            msgpack.pack(envelope, f)
+        os.replace(tmp_path, path)  # never leave a truncated checkpoint behind if we crash while writing
+        logger.info("Checkpoint saved to %s at time %s", path, self.t)
+
+    @classmethod
+    def restore(cls, path, restore_random=True):
+        """Load a simulation saved with checkpoint(); calling run() on it continues exactly where it stopped.
+
+        Unless `restore_random` is False, this also restores the state of the `random` module, for models drawing
+        from it rather than from self.rng.
+        """
+
+        with open(path, 'rb') as f:
+            envelope = msgpack.unpack(f)
+        if envelope.get('format') != CHECKPOINT_FORMAT:
+            raise ValueError(f"{path} is not a simulation checkpoint")
+        if envelope['version'] != CHECKPOINT_VERSION:
+            raise ValueError(f"unsupported checkpoint version {envelope['version']} in {path}")
+        sim = pickle.loads(zlib.decompress(envelope['state']))
+        if not isinstance(sim, cls):
+            raise TypeError(f"{path} holds a {envelope['class']}, not a {cls.__name__}")
+        if restore_random:
+            version, internal_state, gauss_next = envelope['random']
+            random.setstate((version, tuple(internal_state), gauss_next))
+        return sim
+
+    def branch(self, n_branches, mutate_fn, max_t=float('inf'), result_fn=None, seeds=None, max_workers=None):
+        """Run `n_branches` what-if continuations of the simulation from its current state; return their results.
+
+        Each branch runs in a forked child process, which shares the warmed-up state copy-on-write. There it calls
+        `mutate_fn(sim, i)` (i being the branch index), reseeds it (see reseed()) and the `random` module with seeds[i],
+        runs until max_t and sends `result_fn(sim)` back to the parent through a pipe. The results, which must be
+        picklable, are returned in branch order; by default they are the simulations themselves. This simulation
+        and the parent's random state are left untouched.
+
+        By default seeds are derived from the current state of self.rng, so that branching is repeatable with a
+        fixed seed. At most `max_workers` children (default: the number of CPUs) run at once. Where fork() is not
+        available, branches run one after the other on copies of the simulation.
+        """
+
+        if seeds is None:
+            streams = random.Random()
+            streams.setstate(self.rng.getstate())
+            seeds = [streams.getrandbits(64) for _ in range(n_branches)]
+        assert len(seeds) == n_branches
+        if result_fn is None:
+            result_fn = lambda sim: sim
+
+        def run_branch(sim, i):
+            mutate_fn(sim, i)
+            sim.reseed(seeds[i])
+            random.seed(seeds[i])
+            sim.run(max_t)
+            return result_fn(sim)
+
+        if not hasattr(os, 'fork'):
+            random_state = random.getstate()
+            try:
+                return [run_branch(pickle.loads(pickle.dumps(self, pickle.HIGHEST_PROTOCOL)), i)
+                        for i in range(n_branches)]
+            finally:
+                random.setstate(random_state)
+
+        max_workers = max_workers or os.cpu_count() or 1
+        results = []
+        for first in range(0, n_branches, max_workers):
+            children = []
+            for i in range(first, min(first + max_workers, n_branches)):
+                read_fd, write_fd = os.pipe()
+                pid = os.fork()
+                if pid == 0:  # child: run the branch, send back (ok, result or traceback) and exit
+                    os.close(read_fd)
+                    try:
+                        payload = pickle.dumps((True, run_branch(self, i)), pickle.HIGHEST_PROTOCOL)
+                    except BaseException:
+                        payload = pickle.dumps((False, traceback.format_exc()))
+                    with os.fdopen(write_fd, 'wb') as f:
+                        f.write(payload)
+                    os._exit(0)
+                os.close(write_fd)
+                children.append((i, pid, read_fd))
+            payloads = []
+            for i, pid, read_fd in children:  # reap every child of the batch before reporting failures
+                with os.fdopen(read_fd, 'rb') as f:
+                    payloads.append((i, f.read()))
+                os.waitpid(pid, 0)
+            for i, payload in payloads:
+                if not payload:
+                    raise RuntimeError(f"branch {i} died without sending its result")
+                ok, result = pickle.loads(payload)
+                if not ok:
+                    raise RuntimeError(f"branch {i} failed:\n{result}")
+                results.append(result)
+        return results
+
+    def reseed(self, seed):
+        """Restart self.rng from `seed`, as branch() does for each branch.
+
+        Models that draw random values ahead of time from self.rng should extend this to discard them, so that
+        branches don't share them.
+        """
+
+        self.rng.seed(seed)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # itertools.count objects can't be reliably pickled: save the next sequence number instead
+        seq = next(self._seq)
+        self._seq = itertools.count(seq)
+        state['_seq'] = seq
+        state['observers'] = []  # instrumentation belongs to the process, not to the simulation
+        state['profiler'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._seq = itertools.count(state['_seq'])
+
+    def run(self, max_t=float('inf'), max_events=None, max_wall=None, progress=None, progress_interval=1):
+        """Run the simulation. If max_t is specified, stop it at that time.
+
+        Events after max_t are left in the queue, so that calling run() again with a larger max_t resumes it.
+
+        The run also stops, leaving the simulation resumable, after processing `max_events` events or after
+        `max_wall` seconds of wall-clock time. If `progress` is given, it is called about every `progress_interval`
+        wall-clock seconds with a Progress tuple (see print_progress()). Budgets and progress are checked every
+        RUN_CHUNK events, so they add no per-event cost.
+
+        Returns why the run stopped: 'max_t', 'exhausted' (no more events), 'max_events' or 'max_wall'.
+        """
+        logger.info("Simulation starting. max_t=%s", max_t)
+        chunked = max_events is not None or max_wall is not None or progress is not None
+        wall_start = next_progress = time.perf_counter()
+        t_start, events_start = self.t, self.events_processed
+        reason = None
+        while reason is None:
+            until = min(self._next_checkpoint, max_t)  # run up to the checkpoint time, then save
+            limit = self.RUN_CHUNK if chunked else sys.maxsize
+            if max_events is not None:
+                limit = min(limit, events_start + max_events - self.events_processed)
+            exhausted, processed = self._run_until(until, limit)
+            self.events_processed += processed
+            if exhausted:
+                reason = 'exhausted'
+            elif exhausted is None:  # processed `limit` events: check budgets and report progress
+                now = time.perf_counter()
+                if max_events is not None and self.events_processed - events_start >= max_events:
+                    reason = 'max_events'
+                elif max_wall is not None and now - wall_start >= max_wall:
+                    reason = 'max_wall'
+                if progress is not None and (now >= next_progress or reason is not None):
+                    progress(self._progress(max_t, t_start, events_start, wall_start, now))
+                    next_progress = now + progress_interval
+            elif until == max_t:
+                reason = 'max_t'
+            else:
+                self._run_samplers(until, inclusive=True)
+                self._next_checkpoint += self.checkpoint_interval
+                self.checkpoint(self.checkpoint_path)
+        if reason == 'max_t':
+            self._run_samplers(max_t, inclusive=True)
+        elif reason == 'exhausted':
+            if max_t != float('inf'):
+                self._run_samplers(max_t, inclusive=True)
+            else:  # samplers take one last sample, as a self-rescheduling event would
+                for sampler in self.samplers:
+                    self.t = max(self.t, sampler.next_t)
+                    self._call_sampler(sampler)
+                    sampler.advance(sampler.next_t)
+        for observer in self.observers:
+            flush = getattr(observer, 'flush', None)
+            if flush is not None:
+                flush()
+        logger.info("Simulation finished at time %.2f (%s)", self.t, reason)
+        return reason
+
+    def _progress(self, max_t, t_start, events_start, wall_start, now):
+        elapsed = now - wall_start
+        if max_t != float('inf') and self.t > t_start:  # assume simulated time keeps advancing at the same pace
+            eta = elapsed * (max_t - self.t) / (self.t - t_start)
+        else:
+            eta = None
+        events = self.events_processed - events_start
+        return Progress(self.t, events, events / elapsed if elapsed > 0 else 0, len(self.events), elapsed, eta)
+
+    def _run_until(self, max_t, limit):
+        """Process events up to max_t, but at most `limit` of them.
+
+        Returns (exhausted, processed): exhausted is True if the event queue is exhausted, False if the next event is
+        after max_t and None if `limit` was reached; processed counts the popped events, canceled ones included.
+        """
+
+        # observers (e.g., the profiler) need a slower loop measuring each event: use it only when needed
+        return self._run_observed(max_t, limit) if self.observers else self._run_events(max_t, limit)
+
+    def _run_events(self, max_t, limit):
+        """See _run_until()."""
+
+        pop = self.events.pop
+        for processed in range(limit):
+            try:
+                record = pop()
+            except IndexError:  # the event queue is empty
+                return True, processed
+            t, _, _, event, args = record
+            if event is None:  # canceled
+                self.canceled -= 1
+                continue
+            if t > max_t:
+                self.events.push(record)
+                return False, processed
+            if t > self._next_sample:
+                self._run_samplers(t)
             self.t = t
-            #logging.info(f"Processing event '{type(event).__name__}' at time {self.t:.2f}") #Log event processing
-            event.process(self)
-        logging.info(f"Simulation finished at time {self.t:.2f}") #Log simulation end
-        
-    def log_info(self, msg):
-        logging.info(f'{self.t:.2f}: {msg}')
+            record[2] = None  # processed: no longer cancelable
+            if args is None:
+                event.process(self)
+            else:
+                event(*args)
+        return None, limit
+
+    def _run_observed(self, max_t, limit):
+        """Same as _run_events(), but measures each event and reports it to the observers."""
+
+        pop, seq, perf_counter, observers = self.events.pop, self._seq, time.perf_counter, self.observers
+        for processed in range(limit):
+            try:
+                record = pop()
+            except IndexError:
+                return True, processed
+            t, _, _, event, args = record
+            if event is None:
+                self.canceled -= 1
+                continue
+            if t > max_t:
+                self.events.push(record)
+                return False, processed
+            if t > self._next_sample:
+                self._run_samplers(t)
+            self.t = t
+            record[2] = None
+            before = next(seq)
+            start = perf_counter()
+            if args is None:
+                event.process(self)
+            else:
+                event(*args)
+            duration = perf_counter() - start
+            scheduled = next(seq) - before - 1  # sequence numbers consumed by the events scheduled meanwhile
+            name = event_name(event, args)
+            for observer in observers:
+                observer.record(self, name, start, duration, scheduled)
+        return None, limit
+
+    def enable_tracing(self, *categories):
+        """Enable the given trace categories, or all of them if none is given.
+
+        Enabled messages are sent at INFO level to the `libs.discrete_event_sim.<category>` loggers, so the usual
+        logging configuration decides where (and whether) they are written.
+        """
+
+        if not categories:
+            self.traced = ALL_CATEGORIES
+        elif self.traced is not ALL_CATEGORIES:
+            self.traced = self.traced.union(categories)
+
+    def disable_tracing(self):
+        self.traced = frozenset()
+
+    def tracing(self, category):
+        """True if the category is enabled: guard expensive trace() arguments with this."""
+
+        return category in self.traced
+
+    def trace(self, category, msg, *args):
+        """Log `msg % args`, prefixed by the current time, if the category is enabled.
+
+        Nothing is formatted when the category is off, so pass values as arguments rather than building f-strings;
+        arguments that are expensive to compute should be guarded with `if sim.tracing(category):`.
+        """
+
+        if category in self.traced:
+            logger.getChild(category).info('%s: ' + msg, self.format_time(self.t), *args)
+
+    def format_time(self, t):
+        """How times are shown in traces; override for friendlier units."""
+
+        return f'{t:.2f}'
+
+    def log_info(self, msg, *args):
+        """Trace a message in the 'info' category."""
+
+        self.trace('info', msg, *args)
+
+
+Progress = collections.namedtuple('Progress', 't events events_per_s queue_size elapsed eta')
+Progress.__doc__ = """Passed to run() progress callbacks: simulated time, events processed and events per second in this run,
+event queue size, wall-clock seconds elapsed and estimated to completion (None if unknown)."""
+
+
+def print_progress(progress, file=None):
+    """A run() progress callback printing a status line on stderr."""
+
+    eta = '?' if progress.eta is None else f'{progress.eta:.0f}s'
+    print(f"t={progress.t:.6g} events={progress.events:,} ({progress.events_per_s:,.0f}/s) "
+          f"queue={progress.queue_size:,} elapsed={progress.elapsed:.0f}s eta={eta}", file=file or sys.stderr)
+
+
+class _AllCategories:
+    """Stands for the set of all trace categories."""
+
+    def __contains__(self, category):
+        return True
+
+    def __reduce__(self):
+        return 'ALL_CATEGORIES'  # unpickle to the module's singleton
+
+    def __repr__(self):
+        return 'ALL_CATEGORIES'
+
+
+ALL_CATEGORIES = _AllCategories()
+
+
+def event_name(event, args):
+    """A readable name for an event: its class name for Event objects, the function name for callbacks."""
+
+    if args is None:
+        return type(event).__name__
+    return getattr(event, '__qualname__', None) or type(event).__name__
+
+
+class Profiler:
+    """Per-event-type counters collected by Simulation.enable_profiling()."""
+
+    def __init__(self):
+        self.counters = {}  # event name -> [count, total wall time, max wall time, events scheduled]
+
+    def record(self, sim, name, start, duration, scheduled):
+        counters = self.counters.get(name)
+        if counters is None:
+            self.counters[name] = [1, duration, duration, scheduled]
+            return
+        counters[0] += 1
+        counters[1] += duration
+        if duration > counters[2]:
+            counters[2] = duration
+        counters[3] += scheduled
+
+    def stats(self):
+        """Return {event name: {'count', 'total', 'max', 'mean', 'scheduled'}}, times in seconds."""
+
+        return {name: {'count': count, 'total': total, 'max': max_, 'mean': total / count, 'scheduled': scheduled}
+                for name, (count, total, max_, scheduled) in self.counters.items()}
+
+    def report(self):
+        """Return the statistics as a table, sorted by decreasing total time."""
+
+        stats = sorted(self.stats().items(), key=lambda item: item[1]['total'], reverse=True)
+        grand_total = sum(s['total'] for _, s in stats) or 1
+        width = max([len('event')] + [len(name) for name, _ in stats])
+        lines = [f"{'event':{width}} {'count':>10} {'total s':>9} {'%':>5} {'mean us':>9} {'max us':>9} "
+                 f"{'scheduled':>10}"]
+        for name, s in stats:
+            lines.append(f"{name:{width}} {s['count']:10,} {s['total']:9.3f} {100 * s['total'] / grand_total:5.1f} "
+                         f"{1e6 * s['mean']:9.1f} {1e6 * s['max']:9.1f} {s['scheduled']:10,}")
+        return '\n'.join(lines)
+
+
+class ChromeTraceWriter:
+    """Stream processed events to a Chrome trace (JSON array format) file, registered by
+    Simulation.enable_chrome_trace().
+
+    Each event is a complete ("X") slice named after its event type, placed at the wall-clock time it was processed
+    and carrying the simulated time and the number of events it scheduled as arguments. Every `counter_interval`
+    events, counter ("C") tracks record the event-set size and each of `counters`, a {name: function(sim)} dict.
+    Records are buffered and written every `buffer_size` of them, so memory stays bounded on long runs.
+    """
+
+    def __init__(self, path, counters=None, counter_interval=100, buffer_size=10000):
+        self.file = open(path, 'w')
+        self.file.write('[\n{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "simulation"}}')
+        self.counters = counters or {}
+        self.counter_interval = counter_interval
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.events = 0
+        self.origin = time.perf_counter()
+
+    def record(self, sim, name, start, duration, scheduled):
+        ts = 1e6 * (start - self.origin)
+        buffer = self.buffer
+        buffer.append(f',\n{{"name": {json.dumps(name)}, "ph": "X", "pid": 1, "tid": 1, "ts": {ts:.3f}, '
+                      f'"dur": {1e6 * duration:.3f}, "args": {{"t": {sim.t!r}, "scheduled": {scheduled}}}}}')
+        self.events += 1
+        if self.events % self.counter_interval == 0:
+            buffer.append(f',\n{{"name": "event set", "ph": "C", "pid": 1, "ts": {ts:.3f}, '
+                          f'"args": {{"size": {len(sim.events)}}}}}')
+            for counter, fn in self.counters.items():
+                buffer.append(f',\n{{"name": {json.dumps(counter)}, "ph": "C", "pid": 1, "ts": {ts:.3f}, '
+                              f'"args": {{"value": {fn(sim)!r}}}}}')
+        if len(buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.buffer))
+        self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        """Write the remaining records and terminate the JSON array."""
+
+        self.flush()
+        self.file.write('\n]\n')
+        self.file.close()
+
+
+class Sampler:
+    """A periodic sampler registered through Simulation.add_sampler()."""
+
+    __slots__ = ('interval', 'fn', 'args', 'start', 'count', 'next_t')
+
+    def __init__(self, interval, fn, args, start):
+        assert interval > 0
+        self.interval = interval
+        self.fn = fn
+        self.args = args
+        self.start = start
+        self.count = 0  # number of samples taken
+        self.next_t = start
+
+    def advance(self, t):
+        """Move to the first sampling time after t (computed from the start, so that errors don't accumulate)."""
+
+        while self.next_t <= t:
+            self.count += 1
+            self.next_t = self.start + self.count * self.interval
+
+
+class EventHandle:
+    """Returned by Simulation.schedule(); call cancel() to prevent the event from being processed."""
+
+    __slots__ = ('sim', 'record')
+
+    def __init__(self, sim: Simulation, record):
+        self.sim = sim
+        self.record = record
+
+    @property
+    def time(self):
+        """The time at which the event is scheduled."""
+
+        return self.record[0]
+
+    @property
+    def canceled(self):
+        """True if the event was canceled before being processed."""
+
+        return self.record[3] is None
+
+    def cancel(self):
+        """Cancel the event; does nothing if it was already canceled or processed."""
+
+        self.sim.cancel(self.record)
 
 
 class Event:
@@ -50,12 +704,10 @@ class Event:
     Subclass this to represent your events.
 
     You may need to define __init__ to set up all the necessary information.
+    Override `priority` to change the order of events happening at the same time.
     """
 
+    priority = PRIORITY_STATE
+
     def process(self, sim: Simulation):
         raise NotImplementedError
-
-    def __lt__(self, other):
-        """Method needed to break ties with events happening at the same time."""
-
-        return id(self) < id(other)
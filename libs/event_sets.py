@@ -0,0 +1,369 @@
+"""Event-set (pending event list) implementations for `discrete_event_sim.Simulation`.
+
+Every event set stores records whose first item is the event time and which are totally ordered by the builtin
+comparison (tuples or lists); it exposes `push(record)`, `pop()` (raising IndexError when empty), `__len__` and
+`__iter__` (all records, in no particular order). The simulation picks one by name through `make_event_set`.
+
+- `HeapEventSet`: a binary heap through `heapq`, O(log N) per operation;
+- `CalendarQueue`: Brown's calendar queue (CACM 1988), O(1) amortized when event times are spread evenly;
+- `LadderQueue`: Tang, Goh and Thng's ladder queue (TOMACS 2005), O(1) amortized and robust to skewed
+  distributions such as a few far-future events mixed with many near-future ones.
+"""
+
+import bisect
+import functools
+import heapq
+import math
+
+
+class EventSet:
+    """Base class for event sets. Subclasses must define `push`, `pop`, `__len__` and `__iter__`."""
+
+    def push(self, record):
+        raise NotImplementedError
+
+    def pop(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def push_many(self, records):
+        """Add several records at once."""
+
+        for record in records:
+            self.push(record)
+
+    def clear(self):
+        """Remove all records; subclasses may override with something faster."""
+
+        while self:
+            self.pop()
+
+    def rebuild(self, records):
+        """Replace the whole content with `records`."""
+
+        records = list(records)
+        self.clear()
+        self.push_many(records)
+
+
+class HeapEventSet(EventSet):
+    """A binary heap (the `heapq` module) over a plain list."""
+
+    def __init__(self):
+        self.heap = []
+        # partial objects bound to the list are called directly from C, avoiding a Python-level method call
+        self.push = functools.partial(heapq.heappush, self.heap)
+        self.pop = functools.partial(heapq.heappop, self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return iter(self.heap)
+
+    def push_many(self, records):
+        heap = self.heap
+        records = list(records)
+        # heapify is O(N + k); pushing one by one is O(k log(N + k)), which wins only when k is small
+        if len(records) * len(heap).bit_length() > len(heap):
+            heap.extend(records)
+            heapq.heapify(heap)
+        else:
+            for record in records:
+                heapq.heappush(heap, record)
+
+    def clear(self):
+        self.heap.clear()
+
+    def rebuild(self, records):
+        self.heap[:] = records
+        heapq.heapify(self.heap)
+
+
+class CalendarQueue(EventSet):
+    """Brown's calendar queue.
+
+    Records live in `nbuckets` sorted "days" of `width` time units each; a "year" spans all buckets. The number of
+    buckets doubles (halves) when the size grows beyond twice (shrinks below half) the number of buckets, and the
+    width is then re-estimated from the separation between the earliest events.
+
+    Days are identified by their "virtual bucket" `int(t / width)`, so that records with the same time always
+    agree on where they belong regardless of floating point rounding.
+    """
+
+    def __init__(self, nbuckets=2, width=1.0):
+        self.size = 0
+        self.last_time = 0.0  # time of the last dequeued record
+        self._setup(nbuckets, width)
+
+    def _setup(self, nbuckets, width):
+        self.nbuckets = nbuckets
+        self.width = width
+        self.buckets = [[] for _ in range(nbuckets)]
+        self.current = int(self.last_time / width)  # virtual bucket we're dequeueing from
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+    def push(self, record):
+        virtual_bucket = int(record[0] / self.width)
+        bisect.insort(self.buckets[virtual_bucket % self.nbuckets], record)
+        if virtual_bucket < self.current:  # we must step back to this record when dequeueing
+            self.current = virtual_bucket
+        self.size += 1
+        if self.size > 2 * self.nbuckets:
+            self._resize(2 * self.nbuckets)
+
+    def pop(self):
+        if not self.size:
+            raise IndexError("pop from an empty calendar queue")
+        buckets, nbuckets, width = self.buckets, self.nbuckets, self.width
+        virtual_bucket = self.current
+        for _ in range(nbuckets):
+            bucket = buckets[virtual_bucket % nbuckets]
+            if bucket and int(bucket[0][0] / width) <= virtual_bucket:
+                return self._take(virtual_bucket)
+            virtual_bucket += 1
+        # a whole year without events: jump directly to the earliest one
+        head = min(bucket[0] for bucket in buckets if bucket)
+        return self._take(int(head[0] / width))
+
+    def _take(self, virtual_bucket):
+        record = self.buckets[virtual_bucket % self.nbuckets].pop(0)
+        self.current, self.last_time = virtual_bucket, record[0]
+        self.size -= 1
+        if self.size < self.nbuckets // 2 and self.nbuckets > 2:
+            self._resize(self.nbuckets // 2)
+        return record
+
+    def _new_width(self, records):
+        """Estimate a bucket width of about three times the average separation between the earliest records."""
+
+        sample = [record[0] for record in records[:25]]
+        gaps = [b - a for a, b in zip(sample, sample[1:])]
+        if not gaps:
+            return self.width
+        average = sum(gaps) / len(gaps)
+        gaps = [g for g in gaps if g <= 2 * average]  # ignore outliers, as Brown suggests
+        average = sum(gaps) / len(gaps) if gaps else 0
+        return 3 * average if average > 0 else self.width
+
+    def _fill(self, records):
+        """Distribute sorted records over the buckets."""
+
+        width, nbuckets, buckets = self.width, self.nbuckets, self.buckets
+        for record in records:
+            buckets[int(record[0] / width) % nbuckets].append(record)  # records are sorted, so buckets are too
+        if records:
+            self.current = min(self.current, int(records[0][0] / width))
+
+    def _resize(self, nbuckets):
+        records = sorted(self)
+        self._setup(nbuckets, self._new_width(records))
+        self._fill(records)
+
+    def clear(self):
+        self.size = 0
+        self._setup(2, self.width)
+
+    def rebuild(self, records):
+        records = sorted(records)
+        self.size = len(records)
+        self._setup(max(2, len(records) // 2), self._new_width(records))
+        self._fill(records)
+
+    def push_many(self, records):
+        records = list(records)
+        if len(records) > self.size:
+            self.rebuild(list(self) + records)
+        else:
+            super().push_many(records)
+
+
+class _Rung:
+    """A rung of the ladder queue: `len(buckets)` unsorted buckets of `width` time units starting at `start`."""
+
+    __slots__ = ('start', 'width', 'buckets', 'current', 'count')
+
+    def __init__(self, start, width, nbuckets):
+        self.start = start
+        self.width = width
+        self.buckets = [[] for _ in range(nbuckets)]
+        self.current = 0  # buckets before this one have already been consumed
+        self.count = 0
+
+    def index(self, t):
+        return int((t - self.start) / self.width)
+
+    def add(self, record, i):
+        self.buckets[min(i, len(self.buckets) - 1)].append(record)  # guard against floating point rounding
+        self.count += 1
+
+
+class LadderQueue(EventSet):
+    """Tang, Goh and Thng's ladder queue.
+
+    Far-future records are appended unsorted to `top`; when the near future runs out, they are spread over a rung
+    of buckets, and crowded buckets are recursively split into finer rungs. Only the bucket being consumed is kept
+    sorted, as a small heap (`bottom`).
+    """
+
+    THRESHOLD = 50  # buckets with more records than this get split into a new rung rather than sorted
+    MAX_RUNGS = 8
+
+    def __init__(self):
+        self.top = []
+        self.top_min = float('inf')
+        self.top_max = float('-inf')
+        self.top_start = float('-inf')  # records at or after this time go to `top`
+        self.rungs = []
+        self.bottom = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        yield from self.top
+        for rung in self.rungs:
+            for bucket in rung.buckets[rung.current:]:
+                yield from bucket
+        yield from self.bottom
+
+    def push(self, record):
+        self.size += 1
+        t = record[0]
+        if t >= self.top_start:
+            self.top.append(record)
+            if t < self.top_min:
+                self.top_min = t
+            if t > self.top_max:
+                self.top_max = t
+            return
+        for rung in self.rungs:
+            # compare bucket indexes rather than times, so that equal times always end up in the same place
+            i = rung.index(t)
+            if rung.current <= i and rung.current < len(rung.buckets):
+                rung.add(record, i)
+                return
+        heapq.heappush(self.bottom, record)
+
+    def pop(self):
+        if not self.bottom:
+            if not self.size:
+                raise IndexError("pop from an empty ladder queue")
+            self._refill_bottom()
+        self.size -= 1
+        return heapq.heappop(self.bottom)
+
+    def _spawn_from_top(self):
+        top = self.top
+        width = (self.top_max - self.top_min) / len(top)
+        if width <= 0:  # all records share the same time
+            self.bottom = top
+            heapq.heapify(self.bottom)
+            self.top_start = math.nextafter(self.top_max, math.inf)
+        else:
+            rung = _Rung(self.top_min, width, len(top) + 1)
+            for record in top:
+                rung.add(record, rung.index(record[0]))
+            self.rungs.append(rung)
+            self.top_start = rung.start + len(rung.buckets) * width
+        self.top = []
+        self.top_min, self.top_max = float('inf'), float('-inf')
+
+    def _refill_bottom(self):
+        while True:
+            while self.rungs and not self.rungs[-1].count:
+                self.rungs.pop()
+            if not self.rungs:
+                self._spawn_from_top()
+                if self.bottom:
+                    return
+                continue
+            rung = self.rungs[-1]
+            while not rung.buckets[rung.current]:
+                rung.current += 1
+            bucket = rung.buckets[rung.current]
+            rung.buckets[rung.current] = []
+            rung.current += 1
+            rung.count -= len(bucket)
+            if len(bucket) > self.THRESHOLD and len(self.rungs) < self.MAX_RUNGS:
+                bucket_min, bucket_max = min(bucket)[0], max(bucket)[0]
+                if bucket_max > bucket_min:  # split the bucket over a finer rung
+                    child = _Rung(bucket_min, (bucket_max - bucket_min) / len(bucket), len(bucket) + 1)
+                    for record in bucket:
+                        child.add(record, child.index(record[0]))
+                    self.rungs.append(child)
+                    continue
+            heapq.heapify(bucket)
+            self.bottom = bucket
+            return
+
+    def clear(self):
+        self.__init__()
+
+    def rebuild(self, records):
+        records = list(records)
+        self.clear()
+        self.top = records
+        self.size = len(self.top)
+        if self.top:
+            times = [record[0] for record in self.top]
+            self.top_min, self.top_max = min(times), max(times)
+
+
+EVENT_SETS = {
+    'heap': HeapEventSet,
+    'calendar': CalendarQueue,
+    'ladder': LadderQueue,
+}
+
+
+def make_event_set(event_set=None):
+    """Return an event set: `event_set` may be None (the default heap), a name in `EVENT_SETS` or an instance."""
+
+    if event_set is None:
+        return HeapEventSet()
+    if isinstance(event_set, str):
+        try:
+            return EVENT_SETS[event_set]()
+        except KeyError:
+            raise ValueError(f"unknown event set {event_set!r}; choose among {', '.join(EVENT_SETS)}") from None
+    return event_set
+
+
+if __name__ == '__main__':  # sanity check: all implementations must pop records in the same order
+    import random
+
+    for name, cls in EVENT_SETS.items():
+        event_set = cls()
+        popped, now = [], 0
+        for seq in range(100_000):
+            if seq < 50_000:  # hold model: the queue size stays about constant
+                delay = random.expovariate(1)
+            else:  # mix of near-future, far-future and simultaneous events, with the queue growing
+                delay = random.choice([random.expovariate(1), 1e6 * random.random(), 0])
+            event_set.push((now + delay, seq))
+            if seq >= 1000 and (seq < 50_000 or random.random() < 0.45):
+                record = event_set.pop()
+                assert record[0] >= now, (name, record, now)
+                now = record[0]
+                popped.append(record)
+        while event_set:
+            popped.append(event_set.pop())
+        assert len(popped) == 100_000, (name, len(popped))
+        assert all(a <= b for a, b in zip(popped, popped[1:])), name
+        print(f"{name}: ok")
@@ -0,0 +1,56 @@
+"""Independent replications of a simulation, run in parallel processes.
+
+Each replication gets its own random stream, derived from one master seed with numpy's SeedSequence.spawn(), so
+streams don't overlap and the results only depend on the master seed and the replication index -- not on how many
+workers run them or in which order they finish.
+"""
+
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from libs.statistics import mean_confidence_interval
+
+
+def replication_seeds(master_seed, replications):
+    """Return one integer seed per replication, derived from `master_seed` (None: fresh OS entropy)."""
+
+    children = np.random.SeedSequence(master_seed).spawn(replications)
+    return [int.from_bytes(child.generate_state(4).tobytes(), 'little') for child in children]
+
+
+def _run_seeded(fn, seed, args, kwargs):
+    random.seed(seed)  # for models drawing from the random module
+    return fn(seed, *args, **kwargs)
+
+
+def replicate(fn, replications, master_seed=None, max_workers=None, args=(), kwargs=None):
+    """Call `fn(seed, *args, **kwargs)` once per replication in a process pool; return the results in order.
+
+    `fn` builds and runs one simulation, seeding its random number generator(s) from `seed`, and returns a
+    {metric: value} summary (see aggregate()); it must be picklable, i.e., defined at the top level of a module.
+    The `random` module of the worker is also seeded, for models that use it. With max_workers=1, replications run
+    in this process.
+    """
+
+    seeds = replication_seeds(master_seed, replications)
+    kwargs = kwargs or {}
+    if max_workers == 1:
+        state = random.getstate()
+        try:
+            return [_run_seeded(fn, seed, args, kwargs) for seed in seeds]
+        finally:
+            random.setstate(state)
+    with ProcessPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(_run_seeded, fn, seed, args, kwargs) for seed in seeds]
+        return [future.result() for future in futures]
+
+
+def aggregate(results, level=0.95):
+    """Reduce per-replication {metric: value} summaries to {metric: (mean, CI half width)}.
+
+    Replications are independent, so this is a plain Student t interval across them.
+    """
+
+    return {metric: mean_confidence_interval([result[metric] for result in results], level) for metric in results[0]}
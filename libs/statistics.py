@@ -0,0 +1,560 @@
+"""Incremental statistics collectors for simulations.
+
+Every collector is updated in O(1) time and memory, so it can sit on the hot path of a model, and can be merged with
+collectors of the same kind from other replications (see merge()). Register them on a simulation with
+Simulation.add_statistic(), which keeps them in `sim.statistics`.
+"""
+
+import math
+
+
+class Counter:
+    """Count occurrences of something."""
+
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    def increment(self, k=1):
+        self.count += k
+
+    def merge(self, other):
+        result = Counter()
+        result.count = self.count + other.count
+        return result
+
+    def summary(self):
+        return {'count': self.count}
+
+
+class Tally:
+    """Mean, variance, minimum and maximum of a sequence of observations (Welford's algorithm)."""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def variance(self):
+        """The sample variance (nan with fewer than two observations)."""
+
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def merge(self, other):
+        """Combine two tallies as if all observations had been added to one (Chan et al.'s formula)."""
+
+        result = Tally()
+        result.count = count = self.count + other.count
+        if count:
+            delta = other.mean - self.mean
+            result.mean = self.mean + delta * other.count / count
+            result.m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / count
+        result.min = min(self.min, other.min)
+        result.max = max(self.max, other.max)
+        return result
+
+    def summary(self):
+        return {'count': self.count, 'mean': self.mean, 'std': self.std, 'min': self.min, 'max': self.max}
+
+
+class TimeWeighted:
+    """Time average of a piecewise-constant quantity, such as a queue length.
+
+    Call update(t, value) whenever the value changes; the average weighs each value by how long it was held.
+    """
+
+    __slots__ = ('start', 'last_t', 'value', 'area', 'min', 'max')
+
+    def __init__(self, t=0, value=0):
+        self.start = t
+        self.last_t = t
+        self.value = value
+        self.area = 0.0  # integral of the value from start to last_t
+        self.min = value
+        self.max = value
+
+    def update(self, t, value):
+        self.area += self.value * (t - self.last_t)
+        self.last_t = t
+        self.value = value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def add(self, t, delta):
+        """Change the value by `delta` at time t (e.g., +1 on arrivals and -1 on departures)."""
+
+        value = self.value
+        self.area += value * (t - self.last_t)
+        self.last_t = t
+        self.value = value = value + delta
+        if value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def duration(self, t=None):
+        return (self.last_t if t is None else t) - self.start
+
+    def mean(self, t=None):
+        """The time average up to t (by default, up to the last update)."""
+
+        t = self.last_t if t is None else t
+        duration = t - self.start
+        if duration <= 0:
+            return self.value
+        return (self.area + self.value * (t - self.last_t)) / duration
+
+    def merge(self, other):
+        """Pool two observation periods (e.g., two replications): the result averages over their total duration.
+
+        The merged collector is closed: its mean() covers the two periods and it should not be updated further.
+        """
+
+        result = TimeWeighted()
+        result.area = self.area + other.area
+        result.last_t = self.duration() + other.duration()
+        result.value = 0
+        result.min = min(self.min, other.min)
+        result.max = max(self.max, other.max)
+        return result
+
+    def summary(self):
+        return {'mean': self.mean(), 'duration': self.duration(), 'min': self.min, 'max': self.max}
+
+
+class Histogram:
+    """Counts of observations in `bins` equal-width bins between low and high, plus underflow and overflow."""
+
+    __slots__ = ('low', 'high', 'width', 'counts', 'underflow', 'overflow')
+
+    def __init__(self, low, high, bins):
+        assert high > low and bins > 0
+        self.low = low
+        self.high = high
+        self.width = (high - low) / bins
+        self.counts = [0] * bins
+        self.underflow = 0
+        self.overflow = 0
+
+    def add(self, x):
+        if x < self.low:
+            self.underflow += 1
+        elif x >= self.high:
+            self.overflow += 1
+        else:
+            self.counts[min(int((x - self.low) / self.width), len(self.counts) - 1)] += 1
+
+    @property
+    def count(self):
+        return self.underflow + sum(self.counts) + self.overflow
+
+    def edges(self):
+        return [self.low + i * self.width for i in range(len(self.counts) + 1)]
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating within its bin (clamped to [low, high])."""
+
+        rank = q * self.count
+        seen = self.underflow
+        if rank <= seen:
+            return self.low
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank:
+                return self.low + (i + (rank - seen) / count) * self.width
+            seen += count
+        return self.high
+
+    def merge(self, other):
+        assert (self.low, self.high, len(self.counts)) == (other.low, other.high, len(other.counts))
+        result = Histogram(self.low, self.high, len(self.counts))
+        result.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        result.underflow = self.underflow + other.underflow
+        result.overflow = self.overflow + other.overflow
+        return result
+
+    def summary(self):
+        return {'count': self.count, 'underflow': self.underflow, 'overflow': self.overflow,
+                'median': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+
+class LogHistogram:
+    """Counts of positive observations in logarithmic bins, `bins_per_decade` per power of ten.
+
+    Bins are created as needed, so the range doesn't have to be known in advance; this suits heavy-tailed
+    quantities such as response times. Values <= 0 are counted separately as `nonpositive`.
+    """
+
+    __slots__ = ('bins_per_decade', 'counts', 'nonpositive')
+
+    def __init__(self, bins_per_decade=10):
+        self.bins_per_decade = bins_per_decade
+        self.counts = {}  # bin index -> count; bin i covers [10**(i / bins_per_decade), 10**((i + 1) / ...))
+        self.nonpositive = 0
+
+    def add(self, x):
+        if x <= 0:
+            self.nonpositive += 1
+            return
+        i = math.floor(math.log10(x) * self.bins_per_decade)
+        counts = self.counts
+        counts[i] = counts.get(i, 0) + 1
+
+    @property
+    def count(self):
+        return self.nonpositive + sum(self.counts.values())
+
+    def bins(self):
+        """Return sorted (low, high, count) triples for the non-empty bins."""
+
+        return [(10 ** (i / self.bins_per_decade), 10 ** ((i + 1) / self.bins_per_decade), count)
+                for i, count in sorted(self.counts.items())]
+
+    def quantile(self, q):
+        """Estimate the q-quantile by geometric interpolation within its bin."""
+
+        rank = q * self.count
+        seen = self.nonpositive
+        if rank <= seen:
+            return 0.0
+        for low, high, count in self.bins():
+            if seen + count >= rank:
+                return low * (high / low) ** ((rank - seen) / count)
+            seen += count
+        return math.nan
+
+    def merge(self, other):
+        assert self.bins_per_decade == other.bins_per_decade
+        result = LogHistogram(self.bins_per_decade)
+        result.counts = dict(self.counts)
+        for i, count in other.counts.items():
+            result.counts[i] = result.counts.get(i, 0) + count
+        result.nonpositive = self.nonpositive + other.nonpositive
+        return result
+
+    def summary(self):
+        return {'count': self.count, 'median': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+
+class BatchMeans:
+    """Confidence interval for the steady-state mean of a correlated sequence (e.g., successive response times)
+    from a single run, with the batch means method.
+
+    Observations are grouped in consecutive batches whose means are roughly independent when batches are long
+    enough. Memory stays O(`batches`): when 2 * `batches` batches are complete, adjacent ones are merged and the
+    batch size doubles, so there are always between `batches` and 2 * `batches` of them once enough data arrived.
+
+    Batches of independent runs can be pooled with merge(); observations that don't belong to a batch of the result
+    (incomplete batches, and batches left unpaired when the batch size doubles) are kept aside as `extra_sum` and
+    `extra_count`, and only enter `mean` and `count`.
+    """
+
+    __slots__ = ('batches', 'batch_size', 'means', 'current_sum', 'current_count', 'extra_sum', 'extra_count')
+
+    def __init__(self, batches=32):
+        self.batches = batches
+        self.batch_size = 1
+        self.means = []  # means of the complete batches
+        self.current_sum = 0.0  # the batch being filled
+        self.current_count = 0
+        self.extra_sum = 0.0  # observations outside the batches, see merge()
+        self.extra_count = 0
+
+    def add(self, x):
+        self.current_sum += x
+        self.current_count += 1
+        if self.current_count == self.batch_size:
+            means = self.means
+            means.append(self.current_sum / self.batch_size)
+            self.current_sum = 0.0
+            self.current_count = 0
+            if len(means) == 2 * self.batches:
+                self.means = [(means[i] + means[i + 1]) / 2 for i in range(0, len(means), 2)]
+                self.batch_size *= 2
+
+    @property
+    def count(self):
+        return len(self.means) * self.batch_size + self.current_count + self.extra_count
+
+    def _halve(self, means, batch_size):
+        """Merge adjacent batches, doubling their size; an unpaired last batch goes to the extra observations."""
+
+        if len(means) % 2:
+            self.extra_sum += means[-1] * batch_size
+            self.extra_count += batch_size
+            means = means[:-1]
+        return [(means[i] + means[i + 1]) / 2 for i in range(0, len(means), 2)], 2 * batch_size
+
+    def merge(self, other):
+        """Pool the batches of two independent runs (e.g., replications) at the larger of their batch sizes."""
+
+        assert self.batches == other.batches
+        result = BatchMeans(self.batches)
+        result.batch_size = max(self.batch_size, other.batch_size)
+        for part in self, other:
+            result.extra_sum += part.extra_sum + part.current_sum
+            result.extra_count += part.extra_count + part.current_count
+            means, batch_size = part.means, part.batch_size
+            while batch_size < result.batch_size:
+                means, batch_size = result._halve(means, batch_size)
+            result.means = result.means + means
+        while len(result.means) >= 2 * result.batches:
+            result.means, result.batch_size = result._halve(result.means, result.batch_size)
+        return result
+
+    @property
+    def mean(self):
+        """The mean of all observations, including the incomplete batch."""
+
+        count = self.count
+        return (sum(self.means) * self.batch_size + self.current_sum + self.extra_sum) / count if count else math.nan
+
+    def confidence_interval(self, level=0.95):
+        """Return (mean, half width) of the confidence interval on the mean of the complete batches."""
+
+        return mean_confidence_interval(self.means, level)
+
+    def summary(self):
+        mean, half_width = self.confidence_interval()
+        return {'count': self.count, 'batches': len(self.means), 'batch size': self.batch_size, 'mean': mean,
+                'ci': half_width}
+
+
+class Regenerative:
+    """Confidence interval for a ratio estimator over the cycles of a regenerative process.
+
+    When a process probabilistically restarts (e.g., a queueing system becoming empty), its cycles are i.i.d.; if
+    cycle i contributes a total y_i over a length tau_i (e.g., the area under the number of jobs and the duration
+    of the cycle), the steady-state mean is sum(y) / sum(tau). Call add_cycle(y, tau) at each regeneration point.
+    The ratio estimator and its variance are biased with few cycles, so no interval is given below MIN_CYCLES.
+    """
+
+    MIN_CYCLES = 30
+
+    __slots__ = ('cycles', 'sum_y', 'sum_tau', 'sum_yy', 'sum_tautau', 'sum_ytau')
+
+    def __init__(self):
+        self.cycles = 0
+        self.sum_y = self.sum_tau = 0.0
+        self.sum_yy = self.sum_tautau = self.sum_ytau = 0.0
+
+    def add_cycle(self, y, tau):
+        self.cycles += 1
+        self.sum_y += y
+        self.sum_tau += tau
+        self.sum_yy += y * y
+        self.sum_tautau += tau * tau
+        self.sum_ytau += y * tau
+
+    @property
+    def mean(self):
+        return self.sum_y / self.sum_tau if self.sum_tau else math.nan
+
+    def confidence_interval(self, level=0.95):
+        """Return (mean, half width); the half width is nan with fewer than MIN_CYCLES cycles."""
+
+        m = self.cycles
+        r = self.mean
+        if m < self.MIN_CYCLES:
+            return r, math.nan
+        # sample variance of y_i - r * tau_i, from the running sums
+        variance = (self.sum_yy - 2 * r * self.sum_ytau + r * r * self.sum_tautau) / (m - 1)
+        mean_tau = self.sum_tau / m
+        return r, t_quantile(0.5 + level / 2, m - 1) * math.sqrt(max(variance, 0) / m) / mean_tau
+
+    def merge(self, other):
+        """Cycles of independent replications can be pooled."""
+
+        result = Regenerative()
+        for name in Regenerative.__slots__:
+            setattr(result, name, getattr(self, name) + getattr(other, name))
+        return result
+
+    def summary(self):
+        mean, half_width = self.confidence_interval()
+        return {'cycles': self.cycles, 'mean': mean, 'ci': half_width}
+
+
+def normal_quantile(p):
+    """Quantile function of the standard normal distribution (Acklam's approximation, relative error < 1.2e-9)."""
+
+    assert 0 < p < 1
+    a = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02,
+         -3.066479806614716e+01, 2.506628277459239e+00)
+    b = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01,
+         -1.328068155288572e+01)
+    c = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00,
+         4.374664141464968e+00, 2.938163982698783e+00)
+    d = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+    if p < 0.02425 or p > 1 - 0.02425:  # tails
+        q = math.sqrt(-2 * math.log(min(p, 1 - p)))
+        x = (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+            ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+        return x if p < 0.5 else -x
+    q = p - 0.5
+    r = q * q
+    return (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+        (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+
+
+def t_quantile(p, df):
+    """Quantile function of Student's t distribution with df degrees of freedom.
+
+    Exact for df <= 4: closed forms for df = 1, 2 and 4, Newton's method on the closed-form distribution function
+    for df = 3. Otherwise uses the Cornish-Fisher expansion around the normal quantile (Abramowitz and Stegun,
+    26.7.5), within 0.1% for 0.005 <= p <= 0.995 from df = 5 upwards, which is plenty for confidence intervals.
+    """
+
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    if df == 4:
+        root = math.sqrt(4 * p * (1 - p))
+        q = math.cos(math.acos(root) / 3) / root
+        return math.copysign(2 * math.sqrt(q - 1), p - 0.5)
+    if df == 3:
+        t = t_quantile(p, 4)  # close, and on the same side of the root: Newton's method converges monotonically
+        for _ in range(50):
+            theta = math.atan(t / math.sqrt(3))
+            cdf = 0.5 + (theta + math.sin(theta) * math.cos(theta)) / math.pi
+            step = (cdf - p) * math.pi * (3 + t * t) ** 2 / (6 * math.sqrt(3))
+            t -= step
+            if abs(step) <= 1e-15 * abs(t):
+                break
+        return t
+    z = normal_quantile(p)
+    z2 = z * z
+    g1 = (z2 + 1) * z / 4
+    g2 = ((5 * z2 + 16) * z2 + 3) * z / 96
+    g3 = (((3 * z2 + 19) * z2 + 17) * z2 - 15) * z / 384
+    g4 = ((((79 * z2 + 776) * z2 + 1482) * z2 - 1920) * z2 - 945) * z / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def mean_confidence_interval(values, level=0.95):
+    """Return (mean, half width) of the Student t confidence interval on the mean of i.i.d. values."""
+
+    k = len(values)
+    if k == 0:
+        return math.nan, math.nan
+    mean = sum(values) / k
+    if k < 2:
+        return mean, math.nan
+    variance = sum((x - mean) ** 2 for x in values) / (k - 1)
+    return mean, t_quantile(0.5 + level / 2, k - 1) * math.sqrt(variance / k)
+
+
+def mser(series, batch_size=5):
+    """Detect the end of the warm-up transient of an output series with the MSER-m rule (MSER-5 by default).
+
+    The series is averaged in batches of `batch_size`; the truncation point is the number of leading batches d
+    minimizing the variance of the remaining batch means divided by their count squared, searched over the first
+    half of the series only (a minimum further on means the run is too short to settle). Returns the number of
+    observations to discard. O(len(series)).
+    """
+
+    k = len(series) // batch_size
+    if k < 2:
+        return 0
+    means = [sum(series[i * batch_size:(i + 1) * batch_size]) / batch_size for i in range(k)]
+    best, best_d = math.inf, 0
+    tail_sum = tail_squares = 0.0  # sums over means[d:], grown from the end
+    for d in range(k - 1, -1, -1):
+        tail_sum += means[d]
+        tail_squares += means[d] * means[d]
+        n = k - d
+        if d <= k // 2:
+            statistic = (tail_squares - tail_sum * tail_sum / n) / (n * n)
+            if statistic <= best:
+                best, best_d = statistic, d
+    return best_d * batch_size
+
+
+def truncated_mean(series, batch_size=5):
+    """Return (mean after the MSER truncation, number of discarded observations)."""
+
+    discard = mser(series, batch_size)
+    rest = series[discard:]
+    return (sum(rest) / len(rest) if rest else math.nan), discard
+
+
+def merge(collectors):
+    """Reduce collectors of the same kind (e.g., the same statistic from several replications) into one."""
+
+    collectors = iter(collectors)
+    result = next(collectors)
+    for collector in collectors:
+        result = result.merge(collector)
+    return result
+
+
+def merge_statistics(registries):
+    """Merge {name: collector} dicts (such as `sim.statistics` of several replications) name by name."""
+
+    registries = list(registries)
+    return {name: merge(registry[name] for registry in registries) for name in registries[0]}
+
+
+if __name__ == '__main__':  # sanity check
+    import random
+
+    xs = [random.expovariate(1) for _ in range(100_000)]
+    halves = Tally(), Tally()
+    for i, x in enumerate(xs):
+        halves[i % 2].add(x)
+    tally = merge(halves)
+    mean = sum(xs) / len(xs)
+    variance = sum((x - mean) ** 2 for x in xs) / (len(xs) - 1)
+    print(f"tally: mean {tally.mean:.6f} (direct {mean:.6f}), variance {tally.variance:.6f} (direct {variance:.6f})")
+
+    histogram, log_histogram = Histogram(0, 10, 1000), LogHistogram(100)
+    for x in xs:
+        histogram.add(x)
+        log_histogram.add(x)
+    print(f"median: histogram {histogram.quantile(0.5):.4f}, log histogram {log_histogram.quantile(0.5):.4f}, "
+          f"theoretical {math.log(2):.4f}")
+    # tail quantiles (Queues' default resolution), against the exact ones
+    ordered = sorted(xs)
+    for p in 0.95, 0.99, 0.999:
+        print(f"quantile {p}: log histogram {log_histogram.quantile(p):.4f}, "
+              f"exact {ordered[round(p * (len(xs) - 1))]:.4f}")
+
+    # an M/M/1 queue with load 0.5 has on average rho / (1 - rho) = 1 job in the system
+    t, jobs, in_system = 0, 0, TimeWeighted()
+    for _ in range(1_000_000):
+        rate = 0.5 + (1 if jobs else 0)
+        t += random.expovariate(rate)
+        jobs += 1 if random.random() < 0.5 / rate else -1
+        in_system.update(t, jobs)
+    print(f"time-weighted jobs in system: {in_system.mean():.4f}, theoretical 1")
+
+    # a series starting far from its steady state: MSER should cut the transient
+    ys = [10 * math.exp(-i / 200) + random.gauss(0, 1) for i in range(5000)]
+    discard = mser(ys)
+    print(f"MSER-5 truncation of a transient with time constant 200: {discard} observations "
+          f"(mean {sum(ys) / len(ys):.3f} -> {truncated_mean(ys)[0]:.3f}, steady state 0)")
+
+    for df, expected in (1, 12.7062), (2, 4.3027), (3, 3.1824), (4, 2.7764), (5, 2.5706), (10, 2.2281), (31, 2.0395):
+        print(f"t quantile 0.975 with {df} degrees of freedom: {t_quantile(0.975, df):.4f}, tables {expected}")
@@ -14,10 +14,12 @@ MUSTANG_URL = 'https://ftp.pdl.cmu.edu/pub/datasets/ATLAS/mustang/mustang_releas
 # NOTE: if you want to shuffle a trace, have a look at the `random.shuffle` function.
 
 
-def weibull_generator(shape, mean):
-    """Returns a callable that outputs random variables with a Weibull distribution having the given shape and mean."""
+def weibull_generator(shape, mean, rng=random):
+    """Returns a callable that outputs random variables with a Weibull distribution having the given shape and mean.
 
-    return functools.partial(random.weibullvariate, mean / math.gamma(1 + 1 / shape), shape)
+    Values are drawn from `rng`, a random.Random instance (by default, the `random` module)."""
+
+    return functools.partial(rng.weibullvariate, mean / math.gamma(1 + 1 / shape), shape)
 
 
 def isoformat2ts(date_string):
@@ -1,18 +1,32 @@
 import argparse
 import logging
+import math
 import csv
 import sys
 import os
 import threading
+import time
 
 # Add the parent directory of 'implementation' to the system path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from implementation.queue_lindley import LindleyQueues
 from implementation.queue_sim import Queues
+from libs.discrete_event_sim import print_progress
+from libs.event_sets import EVENT_SETS
 #from libs.discrete_event_sim import Simulation, Event
-from random import seed
+from random import Random
 
-CSV_COLUMNS = ['lambd', 'mu', 'max_t', 'n', 'd', 'w', 'queue_size', 'quantum', 'weibull_shape']
+CSV_COLUMNS = ['lambd', 'mu', 'max_t', 'n', 'd', 'w', 'queue_size', 'quantum', 'weibull_shape',
+               'w_ci', 'queue_len', 'queue_len_ci', 'w_quantiles', 'sim_t']
+# sim_t: the simulated time actually run, which is less than max_t if the run stopped early (e.g., --target-precision)
+
+DEFAULT_QUANTILES = [0.5, 0.95, 0.99]  # response time quantiles estimated and written to the CSV
+
+# options that need the event-driven engine: with any of them set, --engine auto doesn't pick the Lindley engine
+# (which also keeps all jobs in memory, hence bounded_memory)
+EVENT_LOOP_OPTIONS = ['restore', 'checkpoint', 'profile', 'chrome_trace', 'max_events', 'max_wall', 'progress',
+                      'target_precision', 'bounded_memory']
 
 # Define multiple parameter lists
 param_lists = {
@@ -77,19 +91,42 @@ param_lists = {
     # Add more lists as needed
 }
 
+def run_to_precision(sim, max_t, target, check_interval, max_events=None, max_wall=None, **run_kwargs):
+    """Run `sim` until the batch-means 95% CI half width of W, relative to its mean, is at most `target`, checking
+    every `check_interval` simulated time units and stopping anyway at max_t.
+
+    Returns (reason, precision): reason is 'precision' if the target was met, otherwise what stopped run().
+    """
+
+    wall_start, events_start = time.perf_counter(), sim.events_processed
+    precision = math.inf
+    while True:
+        if max_wall is not None:  # budgets cover the whole sequence of runs
+            run_kwargs['max_wall'] = max_wall - (time.perf_counter() - wall_start)
+        if max_events is not None:
+            run_kwargs['max_events'] = max_events - (sim.events_processed - events_start)
+        until = min(sim.t + check_interval, max_t)
+        reason = sim.run(until, **run_kwargs)
+        batches = sim.w_batches
+        if len(batches.means) >= batches.batches:  # too few batches would give unreliable intervals
+            mean, half_width = batches.confidence_interval()
+            precision = half_width / mean if mean > 0 else math.inf
+            if precision <= target:
+                return 'precision', precision
+        if reason != 'max_t' or until >= max_t:  # after run(max_t), sim.t is that of the last event or sample
+            return reason, precision
+
+
 def run_simulation(args):
-    params = [getattr(args, column) for column in CSV_COLUMNS[:-4]]
+    params = [getattr(args, column) for column in CSV_COLUMNS[:5]]
     # corresponds to params = [args.lambd, args.mu, args.max_t, args.n, args.d]
 
     if any(x <= 0 for x in params):
         logging.error("lambd, mu, max-t, n and d must all be positive")
         exit(1)
 
-    if args.seed:
-        seed(args.seed)  # set a seed to make experiments repeatable
-    if args.verbose:
-        # output info on stderr
-        logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')
+    # each simulation owns its random generator, so that runs in parallel threads neither share nor race on it
+    rng = Random(args.seed) if args.seed else None  # set a seed to make experiments repeatable
     if args.d > args.n:
         logging.error("The number of queues to sample (d) cannot be greater than the number of servers (n).")
         exit(1)
@@ -98,41 +135,94 @@ def run_simulation(args):
         
     # Suppress matplotlib font manager logs
     # logging.getLogger('matplotlib.font_manager').setLevel(logging.WARNING)
-    sim = Queues(args.lambd, args.mu, args.n, args.d, args.use_rr, args.quantum, args.monitor_interval, args.shape)
-    sim.run(args.max_t)
-
-
-    completions = sim.completions
-    arrivals_log = sim.arrivals_log
-
-    if len(arrivals_log) > 0:
-        # Calculate time for completed jobs
-        completed_w = [completions[job_id] - arrivals_log[job_id] for job_id in completions]
-        # Calculate time for pending jobs (up to simulation end time)
-        pending_jobs = [job_id for job_id in arrivals_log if job_id not in completions]
-        pending_w = [sim.t - arrivals_log[job_id] for job_id in pending_jobs]
-        # Combine and average
-        total_w = completed_w + pending_w
-        w = sum(total_w) / len(total_w)
+    quantiles = getattr(args, 'quantiles', DEFAULT_QUANTILES)
+    if any(not 0 < p < 1 for p in quantiles):
+        logging.error("quantiles must be between 0 and 1")
+        exit(1)
+    engine = getattr(args, 'engine', 'auto')
+    event_loop_options = [name for name in EVENT_LOOP_OPTIONS if getattr(args, name, None)]
+    if engine == 'auto':
+        engine = 'lindley' if LindleyQueues.applicable(args.d, args.use_rr) and not event_loop_options else 'events'
+    if engine == 'lindley':
+        if not LindleyQueues.applicable(args.d, args.use_rr):
+            logging.error("The Lindley engine needs d=1 and FIFO scheduling (no --use-rr)")
+            exit(1)
+        if event_loop_options:
+            logging.error(f"The Lindley engine has no event loop: it doesn't support {', '.join(event_loop_options)}")
+            exit(1)
+        logging.info("FIFO queues with d=1: using the Lindley engine")
+        sim = LindleyQueues(args.lambd, args.mu, args.n, args.d, args.use_rr, args.quantum, args.monitor_interval,
+                            args.shape, rng=rng, quantiles=quantiles)
+    elif getattr(args, 'restore', None):
+        sim = Queues.restore(args.restore)
+    else:
+        sim = Queues(args.lambd, args.mu, args.n, args.d, args.use_rr, args.quantum, args.monitor_interval, args.shape,
+                     getattr(args, 'event_set', 'heap'), rng, keep_jobs=not getattr(args, 'bounded_memory', False),
+                     quantiles=quantiles)
+    if getattr(args, 'checkpoint', None):
+        sim.enable_checkpoints(args.checkpoint, args.checkpoint_every)
+    if getattr(args, 'profile', False):
+        sim.enable_profiling()
+    trace_writer = None
+    if getattr(args, 'chrome_trace', None):
+        trace_writer = sim.enable_chrome_trace(args.chrome_trace, {'jobs in system': Queues.jobs_in_system})
+    run_kwargs = dict(max_events=getattr(args, 'max_events', None), max_wall=getattr(args, 'max_wall', None),
+                      progress=print_progress if getattr(args, 'progress', None) else None,
+                      progress_interval=getattr(args, 'progress', None) or 1)
+    if getattr(args, 'target_precision', None):
+        reason, precision = run_to_precision(sim, args.max_t, args.target_precision, args.precision_check,
+                                             **run_kwargs)
+        print(f"Relative CI half width of W: {precision:.4g} (target {args.target_precision}) "
+              f"after simulated time {sim.t:.2f}" + (" (max-t cap reached)" if reason == 'max_t' else ""))
+    else:
+        reason = sim.run(args.max_t, **run_kwargs)
+    if reason not in ('max_t', 'exhausted', 'precision'):
+        logging.warning(f"Simulation stopped early ({reason}) at time {sim.t:.2f}: results cover only that")
+    if trace_writer is not None:
+        trace_writer.close()
+
+
+    # W from the streaming aggregates, which don't need per-job records (see --bounded-memory): completed jobs
+    # from the response time collector, jobs still in the system from their arrival times
+    completed = sim.response_time
+    pending_w = [sim.t - t for t in sim.pending_arrivals()]
+    if completed.count + len(pending_w) > 0:
+        # average over all arrived jobs, counting pending jobs up to simulation end time
+        w = (completed.mean * completed.count + sum(pending_w)) / (completed.count + len(pending_w))
     else:
         w = 0  # No jobs arrived
 
     print(f"Average time spent in the system: {w}")
 
-
-    completions = sim.completions
-    if len(completions) > 0:
-        w2 = ((sum(completions.values()) - sum(sim.arrivals_log[job_id] for job_id in completions))
-         / len(completions))
     # Calculate average time spent only for completed jobs
-        completed_arrivals = [sim.arrivals[job_id] for job_id in completions]
-        w = (sum(completions.values()) - sum(completed_arrivals)) / len(completions)
-    else :
-        w = 0 # Prevent division by zero
-        
+    w2 = w = completed.mean if completed.count > 0 else 0  # Prevent division by zero
+
     print(f"Average time spent in the system for completed jobs: {w2}")
     print(f"Average time spent in the system: {w}")
 
+    print(f"Mean response time of completed jobs: {sim.response_time.mean} (std {sim.response_time.std})")
+    print(f"Time-average number of jobs in the system: {sim.jobs.mean(sim.t)}")
+    w_mean, w_ci = sim.w_batches.confidence_interval()
+    queue_len, queue_len_ci = sim.queue_len_batches.confidence_interval()
+    print(f"Batch means 95% CIs: W {w_mean} +- {w_ci}, queue length {queue_len} +- {queue_len_ci}")
+    if sim.w_regenerative.cycles >= sim.w_regenerative.MIN_CYCLES:  # otherwise, the intervals are meaningless
+        w_mean, w_regen_ci = sim.w_regenerative.confidence_interval()
+        queue_len_regen, queue_len_regen_ci = sim.queue_len_regenerative.confidence_interval()
+        print(f"Regenerative 95% CIs ({sim.w_regenerative.cycles} cycles): W {w_mean} +- {w_regen_ci}, "
+              f"queue length {queue_len_regen} +- {queue_len_regen_ci}")
+
+    w_quantiles = sim.response_time_quantiles()
+    if w_quantiles:
+        print("Response time quantiles: " + ", ".join(f"P{100 * p:g} {value}" for p, value in w_quantiles.items()))
+
+    if getattr(args, 'truncate_warmup', False):
+        steady = sim.steady_state()
+        w, w_ci = steady['w'], steady['w_ci']
+        queue_len, queue_len_ci = steady['queue_len'], steady['queue_len_ci']
+        print(f"MSER-5 warm-up: discarded the first {steady['w_discarded']} response times and "
+              f"{steady['queue_len_discarded']} queue-length samples (t < {steady['warmup_t']})")
+        print(f"Steady-state 95% CIs: W {w} +- {w_ci}, queue length {queue_len} +- {queue_len_ci}")
+
     if args.mu == 1 and args.lambd != 1:
         W_T=1/(1-args.lambd)
         print(f"Theoretical expectation for random server choice (d=1): {W_T}")    
@@ -144,9 +234,13 @@ def run_simulation(args):
             writer = csv.writer(f)
             # Write headers if file is empty
             if f.tell() == 0:
-                writer.writerow(["lambd", "mu", "max_t", "n", "d", "w", "queue_size", "quantum", "weibull_shape"])
+                writer.writerow(CSV_COLUMNS)
             for i in range(len(sim.queue_size_log)):
-                writer.writerow([args.lambd, args.mu, args.max_t, args.n, args.d, w, sim.queue_size_log[i], args.quantum, args.shape])
+                writer.writerow([args.lambd, args.mu, args.max_t, args.n, args.d, w, sim.queue_size_log[i], args.quantum, args.shape,
+                                 w_ci, queue_len, queue_len_ci, w_quantiles, sim.t])
+
+    if sim.profiler is not None:
+        print(sim.profiler.report())
 
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -162,10 +256,38 @@ def main():
     parser.add_argument('--csv', help="CSV file in which to store results")
     parser.add_argument("--seed", help="random seed")
     parser.add_argument("--verbose", action='store_true')
+    parser.add_argument("--event-set", choices=EVENT_SETS.keys(), default='heap', help="event queue implementation")
+    parser.add_argument("--engine", choices=['auto', 'events', 'lindley'], default='auto',
+                        help="'lindley' computes FIFO queues with d=1 without an event loop; 'auto' uses it "
+                             "whenever it applies")
+    parser.add_argument("--profile", action='store_true', help="print per-event-type processing statistics")
+    parser.add_argument("--chrome-trace", metavar='PATH', help="write processed events as a Chrome/Perfetto trace")
+    parser.add_argument("--max-events", type=int, help="stop after processing this many events")
+    parser.add_argument("--max-wall", type=float, help="stop after this many seconds of wall-clock time")
+    parser.add_argument("--progress", type=float, metavar='SECONDS', help="report progress this often")
+    parser.add_argument("--target-precision", type=float, metavar='REL',
+                        help="stop once the 95%% CI half width of W is within this fraction of W (max-t is a cap)")
+    parser.add_argument("--precision-check", type=float, default=100,
+                        help="simulated time between precision checks")
+    parser.add_argument("--bounded-memory", action='store_true',
+                        help="don't keep arrival and completion times of every job: memory is proportional to the "
+                             "jobs in the system, and results come from streaming statistics")
+    parser.add_argument("--quantiles", type=float, nargs='*', default=DEFAULT_QUANTILES, metavar='P',
+                        help="response time quantiles to estimate (from a logarithmic histogram, without keeping "
+                             "per-job records) and write to the CSV; none to skip them")
+    parser.add_argument("--truncate-warmup", action='store_true',
+                        help="drop the initial transient (MSER-5) from the W and queue length written to the CSV")
+    parser.add_argument("--checkpoint", help="file in which to save checkpoints")
+    parser.add_argument("--checkpoint-every", type=float, default=1000, help="simulated time between checkpoints")
+    parser.add_argument("--restore", help="resume the simulation from this checkpoint (the parameters must match)")
     parser.add_argument("--param-list", choices=param_lists.keys(), help="name of the parameter list to use")
     parser.add_argument("--run-all", action='store_true', help="run all predefined parameter lists")
     args = parser.parse_args()
 
+    if args.verbose:  # logging is configured once here, not by each (possibly threaded) simulation run
+        # output info on stderr
+        logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')
+
     if args.param_list:
         logging.info(f"Running with specified parameter list: {args.param_list}")
         param_set = param_lists[args.param_list]
@@ -5,7 +5,9 @@ import ast
 # 📌 Load CSV File
 def load_csv(file_path):
     #df = pd.read_csv(file_path)
-    df = pd.read_csv(file_path, names=["lambd", "mu", "max_t", "n", "d", "w", "queue_size","quantum","weibull_shape"], skiprows=1)
+    df = pd.read_csv(file_path, names=["lambd", "mu", "max_t", "n", "d", "w", "queue_size","quantum","weibull_shape",
+                                            "w_ci", "queue_len", "queue_len_ci", "w_quantiles", "sim_t"],
+                     skiprows=1)
     return df
 
 # 📌 Plot 1: Queue Length Distribution (CDF)
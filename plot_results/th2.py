@@ -1,16 +1,25 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from implementation.queue_mean_field import fixed_point, tail
 
 # Set up argument parser
 parser = argparse.ArgumentParser(description='Plot results from a CSV file.')
 parser.add_argument('--csv', type=str, required=True, help='Path to the input CSV file.')
 parser.add_argument('--output', type=str, required=True, help='Path to the output image file.')
+parser.add_argument('--mean-field', action='store_true',
+                    help='Also plot the mean-field (n -> infinity) steady state of each configuration, dashed.')
 args = parser.parse_args()
 
 # Assign column names based on the data structure
 #data.columns = ['lambda', 'mu', 'max_t', 'n', 'd', 'average_time_spent', 'queue_sizes', 'waiting_times', 'server_utilizations']
-CSV_COLUMNS = ['lambd', 'mu', 'max_t', 'n', 'd', 'w', 'queue_size',"quantum","weibull_shape"]
+CSV_COLUMNS = ['lambd', 'mu', 'max_t', 'n', 'd', 'w', 'queue_size',"quantum","weibull_shape",
+               "w_ci", "queue_len", "queue_len_ci", "w_quantiles", "sim_t"]
 
 # Read the CSV file
 csv_file = args.csv
@@ -35,7 +44,11 @@ for lambda_value in data['lambd'].unique():
     for q in queue_size_range:
         fraction = sum(1 for size in all_queue_sizes if size >= q) / len(all_queue_sizes)
         fractions.append(fraction)
-    plt.plot(queue_size_range, fractions, marker='o', label=f'lambd={lambda_value}')
+    line, = plt.plot(queue_size_range, fractions, marker='o', label=f'lambd={lambda_value}')
+    if args.mean_field and lambda_value < subset['mu'].iloc[0]:
+        d, mu = int(subset['d'].iloc[0]), subset['mu'].iloc[0]
+        plt.plot(queue_size_range, tail(fixed_point(lambda_value, d, mu), queue_size_range), linestyle='--',
+                 color=line.get_color(), label=f'lambd={lambda_value} (mean field, d={d})')
 
 plt.xlabel('Queue Length (Q)')
 plt.ylabel('Fraction of Queues with at least Q size')
@@ -4,11 +4,15 @@ import argparse
 import collections
 import enum
 import logging
+import os
 import random
+import sys
 
 from matplotlib import pyplot as plt
 
-from discrete_event_sim import Simulation, Event
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libs.discrete_event_sim import Simulation
 
 
 class Condition(enum.Enum):
@@ -26,80 +30,72 @@ class SIR(Simulation):
     list: conditions[i] represent the condition of the i-th individuals.
 
     s, i and r monitor the number of susceptible, infected and recovered individuals over time -- this is sampled
-    periodically through the MonitorSIR event.
+    periodically through the monitor() sampler.
     """
 
-    def __init__(self, population, infected, contact_rate, recovery_rate, plot_interval):
-        super().__init__()  # call the initialization method from Simulation
+    def __init__(self, population, infected, contact_rate, recovery_rate, plot_interval, trace=None, rng=None):
+        super().__init__(rng=rng)  # call the initialization method from Simulation
+        if trace is not None:  # trace categories to enable (all, if empty) before logging the initial infections
+            self.enable_tracing(*trace)
         self.contact_rate = contact_rate
         self.recovery_rate = recovery_rate
         self.conditions = [Condition.SUSCEPTIBLE] * population  # a list of identical items of length 'population'
-        for i in random.sample(range(population), infected):  # starting infected individuals
-            self.infect(i)
+        # starting infected individuals: their first contacts and recoveries are scheduled in bulk
+        initial_calls = []
+        for i in self.rng.sample(range(population), infected):
+            self.trace('infection', "%d infected", i)
+            self.conditions[i] = Condition.INFECTED
+            other = self.rng.randrange(population)
+            initial_calls.append((self.rng.expovariate(self.contact_rate), self.contact, (i, other)))
+            initial_calls.append((self.rng.expovariate(self.recovery_rate), self.recover, (i,)))
+        self.call_many(initial_calls)
         self.s, self.i, self.r = [], [], []  # values of susceptible, infected, recovered over time
-        self.schedule(0, MonitorSIR(plot_interval))
+        self.add_sampler(plot_interval, self.monitor)
 
     def schedule_contact(self, patient):
         """Schedule a patient's next contact."""
 
-        other = random.randrange(len(self.conditions))  # choose a random contact
-        self.schedule(random.expovariate(self.contact_rate), Contact(patient, other))
+        other = self.rng.randrange(len(self.conditions))  # choose a random contact
+        self.call_later(self.rng.expovariate(self.contact_rate), self.contact, patient, other)
 
     def infect(self, i):
         """Patient i is infected."""
 
-        self.log_info(f"{i} infected")
+        self.trace('infection', "%d infected", i)
         self.conditions[i] = Condition.INFECTED
         self.schedule_contact(i)  # schedule the patient's next contact
-        # (further contacts will be scheduled by the Contact event, see the process() function)
-        self.schedule(random.expovariate(self.recovery_rate), Recover(i))  # schedule the patient's recovery
-
-
-class Contact(Event):
-    """A possible contagion event."""
-
-    def __init__(self, source, destination):
-        """Parameters: indexes of both the source and the destination of the possible contagion."""
+        # (further contacts will be scheduled by contact(), see below)
+        self.call_later(self.rng.expovariate(self.recovery_rate), self.recover, i)  # schedule the patient's recovery
 
-        self.source = source
-        self.destination = destination
+    # Contacts and recoveries are scheduled as callbacks through call_later(), without allocating Event objects.
 
-    def process(self, sim):
-        """If the patient is still infectious and the contact is susceptible, the latter will be infected."""
+    def contact(self, source, destination):
+        """A possible contagion: if the source is still infectious and the destination is susceptible, the latter
+        will be infected."""
 
-        sim.log_info(f"{self.source} contacts {self.destination}")
-        if sim.conditions[self.source] != Condition.INFECTED:
+        self.trace('contact', "%d contacts %d", source, destination)
+        if self.conditions[source] != Condition.INFECTED:
             return  # healthy people can't infect
-        if sim.conditions[self.destination] == Condition.SUSCEPTIBLE:
-            sim.infect(self.destination)
-        sim.schedule_contact(self.source)  # schedule the next contact
-
-
-class Recover(Event):
-    """A sick patient recovers."""
-
-    def __init__(self, patient):
-        self.patient = patient
-
-    def process(self, sim):
-        sim.log_info(f"{self.patient} recovered")
-        sim.conditions[self.patient] = Condition.RECOVERED
+        if self.conditions[destination] == Condition.SUSCEPTIBLE:
+            self.infect(destination)
+        self.schedule_contact(source)  # schedule the next contact
 
+    def recover(self, patient):
+        """A sick patient recovers."""
 
-class MonitorSIR(Event):
-    """At any configurable interval, we save the number of susceptible, infected and recovered individuals."""
+        self.trace('recovery', "%d recovered", patient)
+        self.conditions[patient] = Condition.RECOVERED
 
-    def __init__(self, interval=1):
-        self.interval = interval
+    def monitor(self):
+        """At any configurable interval, we save the number of susceptible, infected and recovered individuals."""
 
-    def process(self, sim):
-        ctr = collections.Counter(sim.conditions)
+        ctr = collections.Counter(self.conditions)
         infected = ctr[Condition.INFECTED]
-        sim.s.append(ctr[Condition.SUSCEPTIBLE])
-        sim.i.append(infected)
-        sim.r.append(ctr[Condition.RECOVERED])
-        if infected > 0:  # if nobody is infected anymore, the simulation is over.
-            sim.schedule(self.interval, self)
+        self.s.append(ctr[Condition.SUSCEPTIBLE])
+        self.i.append(infected)
+        self.r.append(ctr[Condition.RECOVERED])
+        if infected == 0:  # if nobody is infected anymore, the simulation is over.
+            return False  # stop sampling
 
 
 def main():
@@ -109,17 +105,17 @@ def main():
     parser.add_argument("--seed", help="random seed")
     parser.add_argument("--avg-contact-time", type=float, default=1)
     parser.add_argument("--avg-recovery-time", type=float, default=3)
-    parser.add_argument("--verbose", action='store_true')
+    parser.add_argument("--verbose", action='store_true', help="trace infections, contacts and recoveries")
     parser.add_argument("--plot_interval", type=float, default=1, help="how often to collect data points for the plot")
     args = parser.parse_args()
 
-    if args.seed:
-        random.seed(args.seed)  # set a seed to make experiments repeatable
     if args.verbose:
         logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')  # output info on stdout
 
     # the rates to use in random.expovariate are 1 over the desired mean
-    sim = SIR(args.population, args.infected, 1 / args.avg_contact_time, 1 / args.avg_recovery_time, args.plot_interval)
+    sim = SIR(args.population, args.infected, 1 / args.avg_contact_time, 1 / args.avg_recovery_time, args.plot_interval,
+              trace=() if args.verbose else None,
+              rng=random.Random(args.seed) if args.seed else None)  # set a seed to make experiments repeatable
     sim.run()
     assert all(c != Condition.INFECTED for c in sim.conditions)  # nobody should be infected at the end of the sim
     print(f"Simulation over at time {sim.t:.2f}")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""Compare events/second between Event subclasses and callbacks scheduled with Simulation.call_later().
+
+Both models run the same workload: `n` independent M/M/1-like servers, where each event draws an exponential delay
+and schedules the next event of the same server, carrying two ints as the queue simulator does.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libs.discrete_event_sim import Simulation, Event
+
+
+class Tick(Event):
+    def __init__(self, server, count):
+        self.server = server
+        self.count = count
+
+    def process(self, sim):
+        sim.processed += 1
+        sim.schedule(random.expovariate(1), Tick(self.server, self.count + 1))
+
+
+class ClassBased(Simulation):
+    def __init__(self, n):
+        super().__init__()
+        self.processed = 0
+        for server in range(n):
+            self.schedule(random.expovariate(1), Tick(server, 0))
+
+
+class CallbackBased(Simulation):
+    def __init__(self, n):
+        super().__init__()
+        self.processed = 0
+        for server in range(n):
+            self.call_later(random.expovariate(1), self.tick, server, 0)
+
+    def tick(self, server, count):
+        self.processed += 1
+        self.call_later(random.expovariate(1), self.tick, server, count + 1)
+
+
+def events_per_second(cls, n, max_t, seed):
+    random.seed(seed)
+    sim = cls(n)
+    start = time.perf_counter()
+    sim.run(max_t)
+    return sim.processed / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--n', type=int, default=1000, help="number of pending events")
+    parser.add_argument('--max-t', type=float, default=2000, help="simulated time")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per style (the best one is reported)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    results = {cls.__name__: max(events_per_second(cls, args.n, args.max_t, args.seed) for _ in range(args.repeat))
+               for cls in (ClassBased, CallbackBased)}
+    for name, rate in results.items():
+        print(f"{name:14} {rate:12,.0f} events/s {rate / results['ClassBased']:6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""Compare the event-set implementations on the queue and storage simulator event mixes.
+
+The queue mix has many near-future events (one completion per busy server plus the next arrival); the storage mix
+adds a far-future Fail event per node (lifetimes of months or centuries) to short transfer and churn events.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'storage_sim')))
+
+from humanfriendly import parse_timespan
+
+from implementation.queue_sim import Queues
+from libs.event_sets import EVENT_SETS
+from storage import Backup, load_nodes
+
+
+def time_run(make_sim, max_t, seed):
+    """Build a simulation with a fixed seed, run it and return the wall-clock time spent in run()."""
+
+    sim = make_sim(random.Random(seed))
+    start = time.perf_counter()
+    sim.run(max_t)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--n', type=int, default=1000, help="number of servers for the queue simulation")
+    parser.add_argument('--d', type=int, default=2, help="number of queues to sample")
+    parser.add_argument('--lambd', type=float, default=0.9, help="arrival rate")
+    parser.add_argument('--queue-max-t', type=float, default=200, help="simulated time for the queue simulation")
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(__file__), '..', 'storage_sim', 'configs',
+                                                         'p2p.cfg'), help="storage simulation configuration")
+    parser.add_argument('--storage-max-t', default="10 years", help="simulated time for the storage simulation")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per configuration (the best one is reported)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workloads = {
+        'queues': (lambda event_set, rng: Queues(args.lambd, 1, args.n, args.d, monitor_interval=10,
+                                                  event_set=event_set, rng=rng),
+                   args.queue_max_t),
+        'storage': (lambda event_set, rng: Backup(load_nodes(args.config), event_set=event_set, rng=rng),
+                    parse_timespan(args.storage_max_t)),
+    }
+    print(f"{'workload':10} {'event set':10} {'seconds':>8} {'relative':>8}")
+    for workload, (factory, max_t) in workloads.items():
+        results = {}
+        for name in EVENT_SETS:
+            results[name] = min(time_run(lambda rng: factory(name, rng), max_t, args.seed) for _ in range(args.repeat))
+        best = min(results.values())
+        for name, seconds in results.items():
+            print(f"{workload:10} {name:10} {seconds:8.3f} {seconds / best:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+"""Compare the throughput of K replications of the queue simulation run one by one through the event loop, and
+advanced together by LockstepQueues.
+
+Both report the average response time over the replications, which should agree within the confidence intervals.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from implementation.queue_lockstep import LockstepQueues
+from implementation.queue_sim import Queues
+from libs.statistics import mean_confidence_interval
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--replications', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--lambd', type=float, default=0.9, help="arrival rate")
+    parser.add_argument('--n', type=int, default=10, help="number of servers")
+    parser.add_argument('--d', type=int, default=2, help="number of queues to sample")
+    parser.add_argument('--max-t', type=float, default=100, help="simulated time of each replication")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'K':>6} {'engine':8} {'seconds':>8} {'jobs/s':>10} {'W':>8} {'CI':>7}")
+    for k in args.replications:
+        start = time.perf_counter()
+        w, completed = [], 0
+        for i in range(k):
+            sim = Queues(args.lambd, 1, args.n, args.d, monitor_interval=args.max_t,
+                         rng=random.Random(args.seed + i))
+            sim.run(args.max_t)
+            w.append(sim.response_time.mean)
+            completed += sim.response_time.count
+        elapsed = time.perf_counter() - start
+        print(f"{k:6} {'events':8} {elapsed:8.2f} {completed / elapsed:10.0f} "
+              "{:8.3f} {:7.3f}".format(*mean_confidence_interval(w)))
+
+        start = time.perf_counter()
+        sim = LockstepQueues(args.lambd, 1, args.n, args.d, k, args.max_t, args.seed)
+        sim.run(args.max_t)
+        elapsed = time.perf_counter() - start
+        print(f"{k:6} {'lockstep':8} {elapsed:8.2f} {sim.completed.sum() / elapsed:10.0f} "
+              "{:8.3f} {:7.3f}".format(*mean_confidence_interval(sim.w_mean.tolist())))
+
+
+if __name__ == '__main__':
+    main()
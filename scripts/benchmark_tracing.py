@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""Measure what tracing costs the storage simulator.
+
+Three runs per configuration with the same seed:
+
+- off: no trace category enabled (the default), so trace() returns right away and guarded arguments (such as the
+  per-node block counts computed at every transfer) are never evaluated;
+- dropped: all categories enabled but the loggers filter INFO out, so arguments are evaluated and nothing is
+  formatted -- roughly what the previous f-string log_info() calls cost with logging off;
+- written: all categories enabled and formatted into a discarding stream.
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'storage_sim')))
+
+from humanfriendly import parse_timespan
+
+from storage import Backup, load_nodes
+
+
+def time_run(config, max_t, seed, trace):
+    sim = Backup(load_nodes(config), rng=random.Random(seed))
+    if trace:
+        sim.enable_tracing()
+    start = time.perf_counter()
+    sim.run(max_t)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(__file__), '..', 'storage_sim', 'configs',
+                                                         'p2p.cfg'), help="storage simulation configuration")
+    parser.add_argument('--max-t', default="10 years", help="simulated time")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per configuration (the best one is reported)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    max_t = parse_timespan(args.max_t)
+    trace_logger = logging.getLogger('libs.discrete_event_sim')
+    trace_logger.propagate = False
+    devnull = open(os.devnull, 'w')
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter('{levelname}:{message}', style='{'))
+    trace_logger.addHandler(handler)
+
+    results = {}
+    for name, trace, level in [('off', False, logging.INFO), ('dropped', True, logging.WARNING),
+                               ('written', True, logging.INFO)]:
+        trace_logger.setLevel(level)
+        results[name] = min(time_run(args.config, max_t, args.seed, trace) for _ in range(args.repeat))
+    devnull.close()
+
+    print(f"{'tracing':8} {'seconds':>8} {'relative':>8}")
+    for name, seconds in results.items():
+        print(f"{name:8} {seconds:8.3f} {seconds / results['off']:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
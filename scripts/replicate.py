@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""Run independent replications of a queue or storage configuration in parallel and report means with CIs.
+
+Examples:
+    scripts/replicate.py --replications 20 queues --lambd 0.9 --n 100 --d 2 --max-t 1000
+    scripts/replicate.py --replications 8 storage storage_sim/configs/p2p.cfg --max-t "10 years"
+    scripts/replicate.py --replications 1000 queues --lockstep --lambd 0.9 --n 10 --d 2 --max-t 1000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'storage_sim')))
+
+from humanfriendly import parse_timespan
+
+from implementation.queue_lockstep import LockstepQueues
+from implementation.queue_sim import Queues
+from libs.replications import aggregate, replicate
+from storage import Backup, load_nodes
+
+
+def queues_replication(seed, lambd, mu, n, d, max_t, use_rr, quantum, shape):
+    sim = Queues(lambd, mu, n, d, use_rr, quantum, max_t, shape, rng=random.Random(seed))
+    sim.run(max_t)
+    return {'w': sim.response_time.mean, 'queue_len': sim.jobs.mean(sim.t) / n, 'completed': sim.response_time.count}
+
+
+def lockstep_replications(replications, seed, lambd, mu, n, d, max_t):
+    """All the replications of queues_replication() at once, in one LockstepQueues (exponential times, FIFO)."""
+
+    sim = LockstepQueues(lambd, mu, n, d, replications, max_t, seed)
+    sim.run(max_t)
+    return [{'w': statistics['response time'].mean, 'queue_len': statistics['jobs in system'].mean() / n,
+             'completed': statistics['response time'].count} for statistics in sim.statistics()]
+
+
+def storage_replication(seed, config, max_t):
+    sim = Backup(load_nodes(config), rng=random.Random(seed))
+    sim.run(max_t)
+    samples = len(sim.up_bw_wasted) or 1
+    return {
+        'transfers': sum(sim.transfer_counts.values()),
+        'failures': sum(sim.failure_events.values()),
+        'upload waste': sum(sim.up_bw_wasted.values()) / samples,
+        'download waste': sum(sim.dw_bw_wasted.values()) / samples,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--replications', type=int, default=10)
+    parser.add_argument('--seed', type=int, help="master seed (default: random)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: number of CPUs)")
+    subparsers = parser.add_subparsers(dest='model', required=True)
+    queues = subparsers.add_parser('queues', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    queues.add_argument('--lambd', type=float, default=0.7, help="arrival rate")
+    queues.add_argument('--mu', type=float, default=1, help="service rate")
+    queues.add_argument('--n', type=int, default=10, help="number of servers")
+    queues.add_argument('--d', type=int, default=2, help="number of queues to sample")
+    queues.add_argument('--max-t', type=float, default=1000, help="simulated time")
+    queues.add_argument('--use-rr', action='store_true', help="use Round Robin scheduling")
+    queues.add_argument('--quantum', type=float, default=1, help="quantum of time for Round Robin")
+    queues.add_argument('--shape', type=float, help="shape parameter for Weibull distribution")
+    queues.add_argument('--lockstep', action='store_true',
+                        help="advance all replications together as NumPy arrays in this process (much faster for "
+                             "many replications; exponential times and FIFO only)")
+    storage = subparsers.add_parser('storage', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    storage.add_argument('config', help="configuration file")
+    storage.add_argument('--max-t', default="10 years", help="simulated time")
+    args = parser.parse_args()
+
+    if args.model == 'queues' and args.lockstep:
+        if args.use_rr or args.shape:
+            parser.error("--lockstep supports neither --use-rr nor --shape")
+        start = time.perf_counter()
+        results = lockstep_replications(args.replications, args.seed, args.lambd, args.mu, args.n, args.d, args.max_t)
+        report(args.replications, time.perf_counter() - start, results)
+        return
+    if args.model == 'queues':
+        fn, kwargs = queues_replication, dict(lambd=args.lambd, mu=args.mu, n=args.n, d=args.d, max_t=args.max_t,
+                                              use_rr=args.use_rr, quantum=args.quantum, shape=args.shape)
+    else:
+        fn, kwargs = storage_replication, dict(config=args.config, max_t=parse_timespan(args.max_t))
+
+    start = time.perf_counter()
+    results = replicate(fn, args.replications, args.seed, args.workers, kwargs=kwargs)
+    report(args.replications, time.perf_counter() - start, results)
+
+
+def report(replications, elapsed, results):
+    print(f"{replications} replications in {elapsed:.1f}s")
+    for metric, (mean, half_width) in aggregate(results).items():
+        print(f"{metric:15} {mean:14.6g} +- {half_width:.4g} (95% CI)")
+
+
+if __name__ == '__main__':
+    main()
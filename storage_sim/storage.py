@@ -4,8 +4,7 @@ import argparse
 import configparser
 import logging
 import random
-from dataclasses import dataclass
-from random import expovariate
+from dataclasses import dataclass, field
 from typing import Optional, List
 
 import matplotlib.pyplot as plt
@@ -21,12 +20,9 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from libs.discrete_event_sim import Simulation, Event
-
-
-def exp_rv(mean):
-    """Return an exponential random variable with the given mean."""
-    return expovariate(1 / mean)
+from libs.discrete_event_sim import Simulation, Event, EventHandle, print_progress
+from libs.event_sets import EVENT_SETS
+from libs.statistics import truncated_mean
 
 
 class DataLost(Exception):
@@ -38,25 +34,55 @@ class Backup(Simulation):
 
     # type annotations for `Node` are strings here to allow a forward declaration:
     # https://stackoverflow.com/questions/36193540/self-reference-or-forward-reference-of-type-annotations-in-python
-    def __init__(self, nodes: List['Node'],parallel_up_down: bool = False):
-        super().__init__()  # call the __init__ method of parent class
-        
-        self.bw_logger = logging.getLogger('BandwidthMetrics')
-        self.bw_logger.addHandler(logging.FileHandler('bw_waste.log'))
-        
+    def __init__(self, nodes: List['Node'],parallel_up_down: bool = False, event_set=None, rng=None,
+                 bw_log: Optional[str] = None):
+        super().__init__(event_set, rng)  # call the __init__ method of parent class
+
+        # each simulation appends its bandwidth samples to its own file (if any): a shared logger with one handler
+        # per instance would write every line once per simulation alive in the process
+        self.bw_log = bw_log
+        self.bw_log_file = None if bw_log is None else open(bw_log, 'a', buffering=1)
+
         self.nodes = nodes
         self.online_nodes = {}  # Track the number of online nodes over time
         self.parallel_up_down = parallel_up_down  # Allow parallel uploads and downloads
         self.transfer_counts = {}  # dictionary to track number of transfers per time step
-        self.schedule(0, LogBandwidthWaste())  # Start periodic bandwidth logging
+        # Start periodic bandwidth logging
+        self.add_sampler(parse_timespan(os.getenv('LOG_INTERVAL', '24 hours')), self.log_bw_waste)
         self.dw_bw_wasted = {}  # Track download bandwidth wasted
         self.up_bw_wasted = {}  # Track upload bandwidth wasted
         self.failure_events = {}  # Track node failure events
         # we add to the event queue the first event of each node going online and of failing
+        self.schedule_many(self.initial_events(nodes))
+
+    def __getstate__(self):
+        """Open files can't be pickled: the bandwidth log is reopened by __setstate__."""
+
+        state = super().__getstate__()
+        state['bw_log_file'] = None
+        return state
+
+    def __setstate__(self, state):
+        """When restored from a checkpoint, reopen the bandwidth log as __init__ does."""
+
+        super().__setstate__(state)
+        if self.bw_log is not None:
+            self.bw_log_file = open(self.bw_log, 'a', buffering=1)
+
+    def exp_rv(self, mean):
+        """Return an exponential random variable with the given mean, drawn from this simulation's generator."""
+        return self.rng.expovariate(1 / mean)
+
+    def initial_events(self, nodes: List['Node']):
+        """Yield (delay, event) pairs for each node going online and failing for the first time."""
+
         for node in nodes:
-            self.schedule(node.arrival_time, Online(node))
-            self.schedule(node.arrival_time + exp_rv(node.average_lifetime), Fail(node))
+            yield node.arrival_time, Online(node)
+            yield node.arrival_time + self.exp_rv(node.average_lifetime), Fail(node)
 
+    def log_bw_waste(self):
+        """Periodic sampler: logs bandwidth waste at the current time."""
+        self.register_bw_waste(self.t)
 
     def register_bw_waste(self, time):
         """Tracks bandwidth waste at each time step."""
@@ -64,7 +90,8 @@ class Backup(Simulation):
         total_up = sum(n.upload_speed - n.available_bw_upload for n in online_nodes)
         total_dw = sum(n.download_speed - n.available_bw_download for n in online_nodes)
         
-        self.bw_logger.info(f"{time}|{len(online_nodes)}|{total_up}|{total_dw}")
+        if self.bw_log_file is not None:
+            self.bw_log_file.write(f"{time}|{len(online_nodes)}|{total_up}|{total_dw}\n")
         
         # Optional: Store in memory for plotting
         self.up_bw_wasted[time] = total_up
@@ -96,7 +123,7 @@ class Backup(Simulation):
         else:
             event = BlockBackupComplete(uploader, downloader, block_id,speed)
 
-        self.schedule(delay, event)
+        event.handle = self.schedule(delay, event)
 
         # Track the transfer in parallel lists
         uploader.current_uploads.append(event)
@@ -109,26 +136,11 @@ class Backup(Simulation):
         # self.log_info(f"scheduled {event.__class__.__name__} from {uploader} to {downloader}"
         #               f" in {format_timespan(delay)}")
 
-    def log_info(self, msg):
+    def format_time(self, t):
         """Override method to get human-friendly logging for time."""
 
-        logging.info(f'{format_timespan(self.t)}: {msg}')
-
-class LogBandwidthWaste:
-    """A periodic event that logs bandwidth waste at fixed intervals."""
-    
-    def __init__(self):
-        pass  # No initialization needed
+        return format_timespan(t)
 
-    def process(self, sim: Backup):
-        """Logs bandwidth waste and re-schedules itself for the next interval."""
-        sim.register_bw_waste(sim.t)  # Log bandwidth waste
-        interval = parse_timespan(os.getenv('LOG_INTERVAL', '24 hours'))
-        sim.schedule(sim.t + interval, LogBandwidthWaste())
-        
-    def __lt__(self, other):
-        """Defines event priority for heap queue."""
-        return isinstance(other, Online)  # Ensure LogBandwidthWaste runs after Online events
 
 @dataclass(eq=False)  # auto initialization from parameters below (won't consider two nodes with same state as equal)
 class Node:
@@ -350,7 +362,7 @@ class Online(NodeEvent):
         #sim.register_bw_waste(sim.t)
         
         # schedule the next offline event
-        sim.schedule(exp_rv(node.average_uptime), Offline(node))
+        sim.schedule(sim.exp_rv(node.average_uptime), Offline(node))
 
 
 class Recover(Online):
@@ -358,13 +370,13 @@ class Recover(Online):
 
     def process(self, sim: Backup):
         node = self.node
-        sim.log_info(f"{node} recovers")
+        sim.trace('node', "%s recovers", node)
         node.failed = False
         # Reset Storage
         self.node.free_space = self.node.storage_size - self.node.block_size * self.node.n
 
         super().process(sim)
-        sim.schedule(exp_rv(node.average_lifetime), Fail(node))
+        sim.schedule(sim.exp_rv(node.average_lifetime), Fail(node))
 
 
 class Disconnection(NodeEvent):
@@ -379,7 +391,7 @@ class Disconnection(NodeEvent):
 
         # Cancel all active uploads
         for transfer in node.current_uploads:
-            transfer.canceled = True
+            transfer.handle.cancel()
             # Remove the transfer from the downloader's current_downloads list if present
             if transfer in transfer.downloader.current_downloads:
                 transfer.downloader.current_downloads.remove(transfer)
@@ -387,7 +399,7 @@ class Disconnection(NodeEvent):
 
         # Cancel all active downloads
         for transfer in node.current_downloads:
-            transfer.canceled = True
+            transfer.handle.cancel()
             # Remove the transfer from the uploader's current_uploads list if present
             if transfer in transfer.uploader.current_uploads:
                 transfer.uploader.current_uploads.remove(transfer)
@@ -406,7 +418,7 @@ class Offline(Disconnection):
         assert node.online
         self.disconnect()
         # schedule the next online event
-        sim.schedule(exp_rv(self.node.average_downtime), Online(node))
+        sim.schedule(sim.exp_rv(self.node.average_downtime), Online(node))
 
 
 class Fail(Disconnection):
@@ -414,8 +426,9 @@ class Fail(Disconnection):
 
     def process(self, sim: Backup):
         #sim.log_info(f"Data lost: {sum(node.failed for node in sim.nodes)}")
-        lost_blocks = sum(1 for block in self.node.local_blocks if block)
-        sim.log_info(f"{self.node} fails - {lost_blocks} blocks lost")
+        if sim.tracing('node'):
+            lost_blocks = sum(1 for block in self.node.local_blocks if block)
+            sim.trace('node', "%s fails - %d blocks lost", self.node, lost_blocks)
 
         self.disconnect()
         node = self.node
@@ -438,11 +451,11 @@ class Fail(Disconnection):
         node.remote_blocks_held.clear()
         node.free_space = node.storage_size - node.block_size * node.n
         # schedule the next online and recover events
-        recover_time = exp_rv(node.average_recover_time)
+        recover_time = sim.exp_rv(node.average_recover_time)
         sim.schedule(recover_time, Recover(node))
         
 
-class DelayedUploadEvent:
+class DelayedUploadEvent(Event):
     """Event to schedule an upload after a delay."""
     
     def __init__(self, node):
@@ -452,9 +465,6 @@ class DelayedUploadEvent:
         """Process the delayed upload event."""
         if self.node.online and not self.node.current_uploads:
             self.node.schedule_next_upload(sim)  # Now it runs at the right time
-    def __lt__(self, other):
-        """Defines event priority for heap queue."""
-        return isinstance(other, LogBandwidthWaste)  # Ensure delayed uploads run before bandwidth logging
 
 @dataclass
 class TransferComplete(Event):
@@ -464,15 +474,14 @@ class TransferComplete(Event):
     downloader: Node
     block_id: int
     speed: float
-    canceled: bool = False
+    handle: Optional[EventHandle] = field(default=None, repr=False, compare=False)  # set by schedule_transfer()
 
     def __post_init__(self):
         assert self.uploader is not self.downloader
 
     def process(self, sim: Backup):
-        sim.log_info(f"Successful transfer: Block {self.block_id} from {self.uploader} to {self.downloader}")
-        if self.canceled:
-            return  # this transfer was canceled, so ignore this event
+        sim.trace('transfer', "Successful transfer: Block %d from %s to %s",
+                  self.block_id, self.uploader, self.downloader)
         uploader, downloader = self.uploader, self.downloader
         assert uploader.online and downloader.online
         self.update_block_state()
@@ -506,10 +515,11 @@ class TransferComplete(Event):
             downloader.schedule_next_download(sim)
 
         
-        for node in [uploader, downloader]:
-            sim.log_info(f"{node}: {sum(node.local_blocks)} local blocks, "
-                         f"{sum(peer is not None for peer in node.backed_up_blocks)} backed up blocks, "
-                         f"{len(node.remote_blocks_held)} remote blocks held")
+        if sim.tracing('blocks'):  # the block counts are only computed when somebody reads them
+            for node in [uploader, downloader]:
+                sim.trace('blocks', "%s: %d local blocks, %d backed up blocks, %d remote blocks held",
+                          node, sum(node.local_blocks), sum(peer is not None for peer in node.backed_up_blocks),
+                          len(node.remote_blocks_held))
 
     def update_block_state(self):
         """Needs to be specified by the subclasses, `BackupComplete` and `DownloadComplete`."""
@@ -534,24 +544,8 @@ class BlockRestoreComplete(TransferComplete):
             owner.local_blocks = [True] * owner.n ###lllllllllllll
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("config", help="configuration file")
-    parser.add_argument("--max-t", default="100 years")
-    parser.add_argument("--seed", help="random seed")
-    parser.add_argument("--verbose", action='store_true')
-    parser.add_argument("--parallel", action='store_true', help="Enable parallel uploads and downloads")
-
-    args = parser.parse_args()
-
-    if args.seed:
-        random.seed(args.seed)  # set a seed to make experiments repeatable
-    if args.verbose:
-        logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')  # output info on stdout
-
-    # Here is where you configure BandwidthMetrics
-    logger = logging.getLogger('BandwidthMetrics')
-    logger.setLevel(logging.INFO)  # or logging.DEBUG if you want more detail
+def load_nodes(config_path: str) -> List[Node]:
+    """Build the list of nodes described by a configuration file."""
 
     # functions to parse every parameter of peer configuration
     parsing_functions = [
@@ -564,7 +558,7 @@ def main():
     ]
 
     config = configparser.ConfigParser()
-    config.read(args.config)
+    config.read(config_path)
     nodes = []  # we build the list of nodes to pass to the Backup class
     for node_class in config.sections():
         class_config = config[node_class]
@@ -572,9 +566,65 @@ def main():
         cfg = [parse(class_config[name]) for name, parse in parsing_functions]
         # the `callable(p1, p2, *args)` idiom is equivalent to `callable(p1, p2, args[0], args[1], ...)
         nodes.extend(Node(f"{node_class}-{i}", *cfg) for i in range(class_config.getint('number')))
-    sim = Backup(nodes,parallel_up_down=args.parallel)
-    sim.run(parse_timespan(args.max_t))
-    sim.log_info(f"Simulation over")
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config", help="configuration file")
+    parser.add_argument("--max-t", default="100 years")
+    parser.add_argument("--seed", help="random seed")
+    parser.add_argument("--verbose", action='store_true', help="trace every category")
+    parser.add_argument("--trace", action='append', choices=['node', 'transfer', 'blocks', 'info'],
+                        help="trace only this category (can be repeated)")
+    parser.add_argument("--parallel", action='store_true', help="Enable parallel uploads and downloads")
+    parser.add_argument("--event-set", choices=EVENT_SETS.keys(), default='heap', help="event queue implementation")
+    parser.add_argument("--profile", action='store_true', help="print per-event-type processing statistics")
+    parser.add_argument("--chrome-trace", metavar='PATH', help="write processed events as a Chrome/Perfetto trace")
+    parser.add_argument("--max-events", type=int, help="stop after processing this many events")
+    parser.add_argument("--max-wall", type=parse_timespan, help="stop after this much wall-clock time")
+    parser.add_argument("--progress", type=parse_timespan, metavar='INTERVAL', help="report progress this often")
+    parser.add_argument("--checkpoint", help="file in which to save checkpoints")
+    parser.add_argument("--checkpoint-every", default="1 year", help="simulated time between checkpoints")
+    parser.add_argument("--restore", help="resume the simulation from this checkpoint (config and seed are ignored)")
+
+    args = parser.parse_args()
+
+    if args.verbose or args.trace:
+        logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')  # output info on stdout
+
+    if args.restore:
+        sim = Backup.restore(args.restore)
+    else:
+        nodes = load_nodes(args.config)
+        rng = random.Random(args.seed) if args.seed else None  # set a seed to make experiments repeatable
+        sim = Backup(nodes,parallel_up_down=args.parallel, event_set=args.event_set, rng=rng, bw_log='bw_waste.log')
+    if args.checkpoint:
+        sim.enable_checkpoints(args.checkpoint, parse_timespan(args.checkpoint_every))
+    if args.verbose:
+        sim.enable_tracing()
+    elif args.trace:
+        sim.enable_tracing(*args.trace)
+    if args.profile:
+        sim.enable_profiling()
+    if args.chrome_trace:
+        trace_writer = sim.enable_chrome_trace(args.chrome_trace)
+    reason = sim.run(parse_timespan(args.max_t), max_events=args.max_events, max_wall=args.max_wall,
+                     progress=print_progress if args.progress else None, progress_interval=args.progress or 1)
+    if reason not in ('max_t', 'exhausted'):
+        logging.warning(f"Simulation stopped early ({reason}) at {format_timespan(sim.t)}")
+    if args.chrome_trace:
+        trace_writer.close()
+    sim.log_info("Simulation over")
+    if sim.profiler is not None:
+        print(sim.profiler.report())
+    if sim.up_bw_wasted:  # report the initial transient of the sampled bandwidth waste
+        sample_times = list(sim.up_bw_wasted)
+        upload_mean, discarded = truncated_mean(list(sim.up_bw_wasted.values()))
+        download_mean, _ = truncated_mean(list(sim.dw_bw_wasted.values()))
+        print(f"MSER-5 warm-up: {discarded} of {len(sample_times)} bandwidth samples discarded "
+              f"(until {format_timespan(sample_times[min(discarded, len(sample_times) - 1)])}); steady-state "
+              f"upload waste {upload_mean:.4g}, download waste {download_mean:.4g}")
 
     import numpy as np
     from plot_utils import (